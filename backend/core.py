@@ -113,7 +113,7 @@ def export_to_excel(rows: List[Dict[str, Any]], filename: Optional[str] = None)
     filename = filename or f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
     filepath = EXPORTS_DIR / filename
     
-    pd.DataFrame(rows).to_excel(filepath, index=False, engine="openpyxl")
+    pd.DataFrame(rows).to_excel(filepath, index=False, engine="xlsxwriter")
     return str(filepath)
 
 
@@ -1,6 +1,8 @@
 import os
 import sqlite3
-from typing import Any, Dict, List, Optional
+import sys
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -8,13 +10,36 @@ from langchain_core.documents import Document
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 
-from logger import (Colors, log_error, log_header, log_info, log_success,
-                    log_warning)
+try:
+    from .logger import (Colors, log_error, log_header, log_info, log_success,
+                         log_warning)
+except ImportError:
+    # Run as a script from the ingestion/ directory
+    from logger import (Colors, log_error, log_header, log_info, log_success,
+                        log_warning)
 
 load_dotenv()
 
 import re
 
+# Patterns for splitting the SQL dump, compiled once
+_RE_TABLE_BLOCK = re.compile(r"(CREATE\s+TABLE\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?)(?=\n(?:CREATE|INSERT|DROP|PRAGMA|$))", re.IGNORECASE)
+_RE_TABLE_NAME = re.compile(r"CREATE\s+TABLE\s+(.*?)\s*\(", re.IGNORECASE | re.DOTALL)
+_RE_CREATE_STATEMENT = re.compile(r"CREATE\s+TABLE\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?;", re.IGNORECASE)
+_RE_INSERT_STATEMENT = re.compile(r"INSERT\s+INTO\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?;", re.IGNORECASE)
+_RE_CREATE_START = re.compile(r"CREATE\s+TABLE", re.IGNORECASE)
+_RE_INSERT_START = re.compile(r"INSERT\s+INTO", re.IGNORECASE)
+
+# The SQL file is scanned in chunks of this size instead of being read whole
+READ_CHUNK_SIZE = 1 << 16
+# Text kept past a match so lookaheads and split keywords see the next chunk
+_CHUNK_MARGIN = 64
+
+EMBEDDING_BATCH_SIZE = 1000
+
+# Statements handed to SQLite per executescript call when building app.db
+SQL_BATCH_SIZE = 500
+
 # Use absolute path or find the file
 sql_file_paths = [
     "data/nstnwnd.sql",
@@ -22,20 +47,45 @@ sql_file_paths = [
     "./data/nstnwnd.sql",
 ]
 
-sql_text = None
-for path in sql_file_paths:
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            sql_text = f.read()
-        break
+DB_PATH = Path(__file__).parent.parent / "data" / "app.db"
+
+# Receives each progress line when ingestion runs in-process
+ProgressCallback = Callable[[str], Any]
 
-if sql_text is None:
-    raise FileNotFoundError("Could not find nstnwnd.sql in any expected location")
 
-# Capture CREATE TABLE ... blocks - look for next CREATE or INSERT or end of CREATE statement
-table_blocks = re.findall(r"(CREATE\s+TABLE\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?)(?=\n(?:CREATE|INSERT|DROP|PRAGMA|$))", sql_text, flags=re.IGNORECASE)
+def _report(log_fn: Callable[[str], None], message: str, progress_cb: Optional[ProgressCallback]):
+    """Log a message and forward it to the progress callback, if any."""
+    log_fn(message)
+    if progress_cb is not None:
+        progress_cb(message)
 
-log_success(f"Found {len(table_blocks)} table definitions")
+
+def iter_matches(path: str, pattern: re.Pattern, start_pattern: re.Pattern):
+    """Yield regex matches from a file read in chunks, without loading it whole.
+    
+    A match is only emitted once enough text follows it that reading more
+    could not change it. Text before the next possible match start
+    (``start_pattern``) is dropped from the buffer.
+    """
+    buffer = ""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            
+            keep_from = 0
+            for match in pattern.finditer(buffer):
+                if not eof and match.end() > len(buffer) - _CHUNK_MARGIN:
+                    break
+                yield match.group(1) if pattern.groups else match.group(0)
+                keep_from = match.end()
+            
+            if eof:
+                return
+            
+            start = start_pattern.search(buffer, keep_from)
+            buffer = buffer[start.start() if start else max(keep_from, len(buffer) - _CHUNK_MARGIN):]
 
 def _clean_identifier(name: str) -> str:
     return name.strip().strip('`"[]')
@@ -44,7 +94,7 @@ def sql_table_to_text(sql_block: str) -> dict:
     """Extract table name and return the CREATE TABLE statement."""
     # extract the block header (up to first '(') to find table name
     table_name = "unknown"
-    m_name = re.search(r"CREATE\s+TABLE\s+(.*?)\s*\(", sql_block, flags=re.IGNORECASE | re.DOTALL)
+    m_name = _RE_TABLE_NAME.search(sql_block)
     if m_name:
         raw = m_name.group(1).strip()
         # if schema-qualified like dbo."Order Details", take last part
@@ -61,97 +111,134 @@ def sql_table_to_text(sql_block: str) -> dict:
     }
 
 
-# Create documents: one per CREATE TABLE statement
-documents = []
-for block in table_blocks:
-    tbl_info = sql_table_to_text(block)
-    table_name = tbl_info.get("table", "unknown")
-
-    # Use the full CREATE TABLE statement as-is
-    documents.append({
-        "text": tbl_info.get("text", ""),
-        "metadata": {
-            "source": "nstnwnd.sql",
-            "type": "table_schema",
-            "table": table_name,
-        },
-    })
-
-log_success(f"Prepared {len(documents)} CREATE TABLE documents for embedding")
-log_info(f"  - Tables: {len(documents)}")
-
-# Convert documents to Langchain Document objects without splitting
-# Keep each CREATE TABLE as a single document
-final_docs: List[Document] = []
-for doc in documents:
-    final_docs.append(Document(page_content=doc["text"], metadata=doc["metadata"]))
-
-log_success(f"Final document count after splitting: {len(final_docs)}")
-
-# Initialize embeddings
-embeddings = OpenAIEmbeddings(
-    model="text-embedding-3-small",
-    show_progress_bar=False,
-    chunk_size=50,
-    retry_min_seconds=10
-)
-
-# Initialize Pinecone vector store
-vector_store = PineconeVectorStore(
-    index_name=os.getenv("INDEX_NAME"),
-    embedding=embeddings,
-)
-# Store documents in vector store
-vector_store.add_documents(final_docs)
-log_success("Ingestion complete: SQL schema documents have been embedded and stored.")
-
-# Create SQLite database from SQL file
-db_path = Path(__file__).parent.parent / "data" / "app.db"
-try:
-    # Connect to SQLite database (creates it if it doesn't exist)
-    conn = sqlite3.connect(str(db_path))
-    cursor = conn.cursor()
+def load_schema_documents(sql_path: str, progress_cb: Optional[ProgressCallback] = None) -> List[Document]:
+    """Build one Document per CREATE TABLE statement in the SQL file."""
+    # Capture CREATE TABLE ... blocks - look for next CREATE or INSERT or end of CREATE statement
+    documents = []
+    for block in iter_matches(sql_path, _RE_TABLE_BLOCK, _RE_CREATE_START):
+        tbl_info = sql_table_to_text(block)
+        table_name = tbl_info.get("table", "unknown")
+        
+        # Use the full CREATE TABLE statement as-is
+        documents.append({
+            "text": tbl_info.get("text", ""),
+            "metadata": {
+                "source": "nstnwnd.sql",
+                "type": "table_schema",
+                "table": table_name,
+            },
+        })
     
-    # Extract CREATE TABLE and INSERT statements
-    create_statements = re.findall(
-        r"CREATE\s+TABLE\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?;",
-        sql_text,
-        flags=re.IGNORECASE
+    _report(log_success, f"Found {len(documents)} table definitions", progress_cb)
+    _report(log_success, f"Prepared {len(documents)} CREATE TABLE documents for embedding", progress_cb)
+    
+    # Convert documents to Langchain Document objects without splitting
+    # Keep each CREATE TABLE as a single document
+    return [Document(page_content=doc["text"], metadata=doc["metadata"]) for doc in documents]
+
+
+def store_documents(final_docs: List[Document], progress_cb: Optional[ProgressCallback] = None):
+    """Embed the documents and upsert them into the Pinecone index."""
+    # Initialize embeddings
+    # Must match the Pinecone index dimension and EMBEDDING_DIMENSIONS used by the app
+    embeddings = OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        dimensions=int(os.getenv("EMBEDDING_DIMENSIONS", "512")),
+        show_progress_bar=False,
+        # Up to 1000 inputs per embeddings request (the API caps at 2048)
+        chunk_size=EMBEDDING_BATCH_SIZE,
+        retry_min_seconds=10
     )
     
-    insert_statements = re.findall(
-        r"INSERT\s+INTO\s+[\[\`\"]?\w+[\]\`\"]?[\s\S]*?;",
-        sql_text,
-        flags=re.IGNORECASE
+    # Initialize Pinecone vector store
+    vector_store = PineconeVectorStore(
+        index_name=os.getenv("INDEX_NAME"),
+        embedding=embeddings,
     )
+    # Store documents in vector store, embedding them in as few requests as possible
+    vector_store.add_documents(final_docs, embedding_chunk_size=EMBEDDING_BATCH_SIZE)
+    _report(log_success, "Ingestion complete: SQL schema documents have been embedded and stored.", progress_cb)
+
+
+def execute_statements(conn: sqlite3.Connection, statements, kind: str) -> int:
+    """Execute SQL statements in batches, returning how many succeeded.
     
-    # Execute each CREATE TABLE statement
-    create_count = 0
-    for statement in create_statements:
+    Each batch runs as one executescript transaction. If anything in a batch
+    fails, it is rolled back and re-run statement by statement so good
+    statements still apply and failures are logged individually.
+    """
+    count = 0
+    statements = iter(statements)
+    while batch := list(islice(statements, SQL_BATCH_SIZE)):
         try:
-            cursor.execute(statement)
-            create_count += 1
-        except sqlite3.Error as e:
-            log_warning(f"SQL Error executing CREATE TABLE: {e}")
+            conn.executescript("BEGIN;\n" + "\n".join(batch) + "\nCOMMIT;")
+            count += len(batch)
             continue
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.rollback()
+        
+        for statement in batch:
+            try:
+                conn.execute(statement)
+                count += 1
+            except sqlite3.Error as e:
+                log_warning(f"SQL Error executing {kind}: {e}")
+        conn.commit()
     
-    # Execute each INSERT statement
-    insert_count = 0
-    for statement in insert_statements:
-        try:
-            cursor.execute(statement)
-            insert_count += 1
-        except sqlite3.Error as e:
-            log_warning(f"SQL Error executing INSERT: {e}")
-            continue
+    return count
+
+
+def build_database(sql_path: str, db_path: Path = DB_PATH, progress_cb: Optional[ProgressCallback] = None):
+    """Create the SQLite database from the CREATE TABLE and INSERT statements."""
+    # Connect to SQLite database (creates it if it doesn't exist)
+    conn = sqlite3.connect(str(db_path))
+    
+    # The database is rebuilt from the dump, so skip fsyncs during the bulk load
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    
+    # Extract CREATE TABLE and INSERT statements
+    create_statements = iter_matches(sql_path, _RE_CREATE_STATEMENT, _RE_CREATE_START)
+    insert_statements = iter_matches(sql_path, _RE_INSERT_STATEMENT, _RE_INSERT_START)
+    
+    create_count = execute_statements(conn, create_statements, "CREATE TABLE")
+    insert_count = execute_statements(conn, insert_statements, "INSERT")
     
-    conn.commit()
     conn.close()
     
-    log_success(f"Database created successfully: {db_path}")
-    log_info(f"  - Tables created: {create_count}")
-    log_info(f"  - Rows inserted: {insert_count}")
+    _report(log_success, f"Database created successfully: {db_path}", progress_cb)
+    _report(log_info, f"  - Tables created: {create_count}", progress_cb)
+    _report(log_info, f"  - Rows inserted: {insert_count}", progress_cb)
+
+
+def main(sql_path: Optional[Path] = None, progress_cb: Optional[ProgressCallback] = None) -> int:
+    """Embed the schema and rebuild app.db from the SQL file; returns an exit code.
+    
+    ``progress_cb`` receives each progress line, so callers running this
+    in-process (such as the ingestion page) can stream it as it happens.
+    """
+    if sql_path is None:
+        sql_path = next((path for path in sql_file_paths if os.path.exists(path)), None)
+    if sql_path is None or not os.path.exists(sql_path):
+        _report(log_error, "Could not find nstnwnd.sql in any expected location", progress_cb)
+        return 1
     
-except Exception as e:
-    log_error(f"Failed to create database: {e}")
-    raise
\ No newline at end of file
+    try:
+        final_docs = load_schema_documents(str(sql_path), progress_cb)
+        store_documents(final_docs, progress_cb)
+    except Exception as e:
+        _report(log_error, f"Failed to store schema documents: {e}", progress_cb)
+        return 1
+    
+    try:
+        build_database(str(sql_path), progress_cb=progress_cb)
+    except Exception as e:
+        _report(log_error, f"Failed to create database: {e}", progress_cb)
+        return 1
+    
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,16 @@ SchemaSense - Natural Language to SQL Chat Interface
 Modular implementation with clean separation of concerns.
 """
 
-import io
+import logging
+import os
+
 import streamlit as st
 
 from src.state import init_session_state, clear_chat
 from src.ui import (
+    clear_query_cache,
     render_chat_history,
+    render_new_messages,
     render_sql_approval,
     process_user_input,
 )
@@ -19,6 +23,18 @@ from src.ui import (
 
 st.set_page_config(page_title="SchemaSense", layout="centered")
 
+# Chat-turn tracebacks are only formatted and printed with SCHEMASENSE_DEBUG=1.
+# Only this child logger is gated; other schemasense.* loggers propagate as
+# usual. The script reruns on every interaction, so the handler is attached
+# only once.
+logger = logging.getLogger("schemasense.chat")
+if not logger.handlers:
+    if os.getenv("SCHEMASENSE_DEBUG") == "1":
+        logger.addHandler(logging.StreamHandler())
+    else:
+        logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
 # ============================================================================
 # SESSION STATE INITIALIZATION
 # ============================================================================
@@ -39,6 +55,9 @@ with st.sidebar:
     if st.button("Clear Chat", use_container_width=True):
         clear_chat()
         st.rerun()
+    if st.button("Refresh Data", use_container_width=True):
+        # Re-run queries against the database instead of cached results
+        clear_query_cache()
     
     st.divider()
     st.caption("Ask questions about your data in natural language.")
@@ -46,70 +65,50 @@ with st.sidebar:
 # Render chat history
 render_chat_history()
 
-# Pending SQL approval
-if st.session_state.pending_sql:
-    pending = st.session_state.pending_sql
-    render_sql_approval(
-        pending["sql"],
-        auto_export=pending.get("auto_export", False),
-        export_format=pending.get("export_format"),
-        auto_chart=pending.get("auto_chart", False),
-        chart_type=pending.get("chart_type"),
-    )
-
-# Chat input
-if prompt := st.chat_input("Ask a question (e.g., 'show me all categories')"):
-    # Clear any pending SQL when new prompt comes in
-    if st.session_state.pending_sql:
-        st.session_state.pending_sql = None
+
+@st.fragment
+def chat_turn():
+    """Approval UI, chat input and new messages.
     
-    # Show user message immediately
-    with st.chat_message("user"):
-        st.markdown(prompt)
+    Runs as a fragment so submitting a prompt or approving SQL reruns only
+    this part; the history above is not redrawn until the next full run.
+    """
+    # Messages added by earlier runs of this fragment
+    render_new_messages()
     
-    # Process and show assistant response
-    with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                result = process_user_input(prompt)
-                
-                if result["type"] in ("sql", "sql_and_export", "sql_and_chart"):
-                    # SQL needs approval - rerun to show approval UI
-                    st.rerun()
-                
-                elif result["type"] == "export":
-                    # Get the last message (the export message we just added)
-                    last_msg = st.session_state.messages[-1]
-                    st.markdown(last_msg["content"])
-                    if last_msg.get("file_data"):
-                        st.download_button(
-                            label=f"Download {last_msg.get('file_name', 'file')}",
-                            data=last_msg["file_data"],
-                            file_name=last_msg["file_name"],
-                            mime=last_msg["file_mime"],
-                            use_container_width=True,
-                        )
-                
-                elif result["type"] == "chart":
-                    # Chart from existing data - display it
-                    last_msg = st.session_state.messages[-1]
-                    st.markdown(last_msg["content"])
-                    if last_msg.get("chart_data"):
-                        st.image(io.BytesIO(last_msg["chart_data"]), use_container_width=True)
-                        st.download_button(
-                            label=f"Download {last_msg.get('file_name', 'chart.png')}",
-                            data=last_msg["chart_data"],
-                            file_name=last_msg.get("file_name", "chart.png"),
-                            mime=last_msg.get("file_mime", "image/png"),
-                            use_container_width=True,
-                        )
-                
-                else:
-                    # Regular answer - show it
-                    last_msg = st.session_state.messages[-1]
-                    st.markdown(last_msg["content"])
-                    
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-                import traceback
-                traceback.print_exc()
+    # Pending SQL approval
+    if st.session_state.pending_sql:
+        pending = st.session_state.pending_sql
+        render_sql_approval(
+            pending["sql"],
+            auto_export=pending.get("auto_export", False),
+            export_formats=pending.get("export_formats"),
+            auto_chart=pending.get("auto_chart", False),
+            chart_type=pending.get("chart_type"),
+        )
+    
+    # Chat input
+    if prompt := st.chat_input("Ask a question (e.g., 'show me all categories')"):
+        # Clear any pending SQL when new prompt comes in
+        if st.session_state.pending_sql:
+            st.session_state.pending_sql = None
+        
+        # Show user message immediately
+        with st.chat_message("user"):
+            st.markdown(prompt)
+        
+        # Process and show assistant response
+        with st.chat_message("assistant"):
+            with st.spinner("Thinking..."):
+                try:
+                    process_user_input(prompt)
+                except Exception as e:
+                    st.error(f"Error: {str(e)}")
+                    logger.exception("chat_turn_failed")
+                    return
+        
+        # Redraw the fragment with the new messages (or the approval UI)
+        st.rerun(scope="fragment")
+
+
+chat_turn()
@@ -3,11 +3,17 @@ SchemaSense - SQL Ingestion Page
 Upload and process SQL files to populate the vector database.
 """
 
-import subprocess
+import queue
+import threading
+import time
 from pathlib import Path
 
 import streamlit as st
 
+from ingestion.ingestion import main as run_ingestion
+from src.llm import clear_retrieval_cache
+from src.ui import clear_query_cache
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -15,9 +21,27 @@ import streamlit as st
 st.set_page_config(page_title="Ingestion | SchemaSense", layout="centered")
 
 PROJECT_ROOT = Path(__file__).parent.parent
-VENV_PYTHON = PROJECT_ROOT / ".venv" / "bin" / "python"
-INGESTION_SCRIPT = PROJECT_ROOT / "ingestion" / "ingestion.py"
 SQL_FILE_PATH = PROJECT_ROOT / "data" / "nstnwnd.sql"
+INGESTION_TIMEOUT = 300
+
+
+@st.cache_resource
+def _ingestion_slot() -> dict:
+    """Process-wide handle on the running ingestion worker.
+    
+    A worker thread can't be killed, so one that outlives the timeout keeps
+    writing app.db and the index; the slot stops a second run from starting
+    alongside it, from this or any other session.
+    """
+    return {"lock": threading.Lock(), "worker": None}
+
+
+def _ingest(outcome: dict, progress: "queue.Queue[str]"):
+    """Worker body: record main's exit code, or the exception it raised."""
+    try:
+        outcome["code"] = run_ingestion(SQL_FILE_PATH, progress_cb=progress.put)
+    except Exception as e:
+        outcome["error"] = e
 
 # ============================================================================
 # UI
@@ -38,39 +62,66 @@ uploaded_file = st.file_uploader(
 if uploaded_file:
     st.success(f"**{uploaded_file.name}** ({uploaded_file.size:,} bytes)")
     
-    if st.button("Start Ingestion", use_container_width=True, type="primary"):
+    slot = _ingestion_slot()
+    running = slot["worker"] is not None and slot["worker"].is_alive()
+    if running:
+        st.warning("An earlier ingestion is still running. Wait for it to finish before starting another.")
+    
+    if st.button("Start Ingestion", use_container_width=True, type="primary", disabled=running):
+        # Claim the slot atomically so two sessions can't both start a run
+        progress: "queue.Queue[str]" = queue.Queue()
+        outcome = {}
+        worker = threading.Thread(target=_ingest, args=(outcome, progress), daemon=True)
+        with slot["lock"]:
+            if slot["worker"] is not None and slot["worker"].is_alive():
+                worker = None
+            else:
+                slot["worker"] = worker
+        
+        if worker is None:
+            st.warning("An ingestion is already running.")
+            st.stop()
+        
         # Save file
         with st.status("Processing...", expanded=True) as status:
             st.write("Saving SQL file...")
             SQL_FILE_PATH.write_bytes(uploaded_file.getbuffer())
             
-            st.write("Running ingestion script...")
+            st.write("Running ingestion...")
             
             try:
-                result = subprocess.run(
-                    [str(VENV_PYTHON), str(INGESTION_SCRIPT)],
-                    cwd=str(PROJECT_ROOT),
-                    capture_output=True,
-                    text=True,
-                    timeout=300,
-                )
+                # Run ingestion in-process on a worker thread and stream its
+                # progress lines as they arrive
+                worker.start()
+                
+                deadline = time.monotonic() + INGESTION_TIMEOUT
+                while worker.is_alive() or not progress.empty():
+                    if time.monotonic() > deadline:
+                        break
+                    try:
+                        st.write(progress.get(timeout=0.1))
+                    except queue.Empty:
+                        pass
                 
-                if result.returncode == 0:
+                if worker.is_alive():
+                    status.update(label="Timeout", state="error")
+                    st.error(
+                        "Ingestion timed out after 5 minutes. It is still finishing in the "
+                        "background; a new run can start once it is done."
+                    )
+                elif "error" in outcome:
+                    status.update(label="Ingestion Failed", state="error")
+                    st.error(f"Error: {outcome['error']}")
+                elif outcome.get("code") == 0:
+                    # Schema docs and app.db changed, so cached retrievals,
+                    # query results and LLM replies are stale
+                    clear_retrieval_cache()
+                    clear_query_cache()
                     status.update(label="Ingestion Complete!", state="complete")
-                    if result.stdout:
-                        st.code(result.stdout, language="")
                     st.balloons()
                 else:
                     status.update(label="Ingestion Failed", state="error")
-                    if result.stderr:
-                        st.error(result.stderr)
-                    if result.stdout:
-                        st.code(result.stdout, language="")
-                        
-            except subprocess.TimeoutExpired:
-                status.update(label="Timeout", state="error")
-                st.error("Ingestion timed out after 5 minutes.")
-                
+                    
             except Exception as e:
                 status.update(label="Error", state="error")
                 st.error(f"Error: {str(e)}")
@@ -1,6 +1,6 @@
 """Chart generation and customization."""
 
 from .generator import generate_chart
-from .themes import CHART_THEMES
+from .themes import CHART_THEMES, ThemeConfig
 
-__all__ = ["generate_chart", "CHART_THEMES"]
+__all__ = ["generate_chart", "CHART_THEMES", "ThemeConfig"]
@@ -1,15 +1,74 @@
 """Chart generation functionality."""
 
 import io
-from typing import Any, Dict, List, Optional
-from datetime import datetime
+import queue
+import time
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+
+import matplotlib
+matplotlib.use("Agg")  # Non-interactive backend
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 import pandas as pd
+from PIL import Image
 from .themes import CHART_THEMES
 
+CHART_DPI = 150
+
+# Encoders for the rendered Agg buffer: format -> (mime, file extension, Pillow options).
+# PNG uses a low zlib level since encode time dominates for interactive charts.
+# SVG has no Pillow options: it is written as vectors and never rasterized.
+IMAGE_FORMATS = {
+    "webp": ("image/webp", "webp", {"quality": 85, "method": 4}),
+    "png": ("image/png", "png", {"compress_level": 1}),
+    "svg": ("image/svg+xml", "svg", None),
+}
+
+# Idle figures (with their axes) kept per figure size so repeated charts
+# skip figure and axes construction
+FIG_POOL_SIZE = 4
+
+_DEFAULT_SUBPLOT_PARAMS = {
+    side: matplotlib.rcParams[f"figure.subplot.{side}"]
+    for side in ("left", "right", "bottom", "top", "wspace", "hspace")
+}
+
+_FIG_POOL: Dict[Tuple[float, float], "queue.LifoQueue[Tuple[Figure, Any]]"] = {}
+
+
+def _acquire_figure(figure_size: tuple) -> Tuple[Figure, Any]:
+    """Take a figure and cleared axes from the pool, or create them."""
+    pool = _FIG_POOL.setdefault(tuple(figure_size), queue.LifoQueue(maxsize=FIG_POOL_SIZE))
+    try:
+        fig, ax = pool.get_nowait()
+        # Resets artists, ticks and the legend; colors are set per chart, and
+        # the equal aspect, data-limit adjustment and hidden frame a pie
+        # chart leaves behind are undone explicitly
+        ax.clear()
+        ax.set_aspect("auto")
+        ax.set_adjustable("box")
+        ax.set_frame_on(True)
+        # tight_layout starts from the current margins; restoring the
+        # defaults keeps its result identical to a fresh figure
+        fig.subplots_adjust(**_DEFAULT_SUBPLOT_PARAMS)
+    except queue.Empty:
+        fig = Figure(figsize=figure_size, dpi=CHART_DPI)
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+    return fig, ax
+
+
+def _release_figure(fig: Figure, ax: Any, figure_size: tuple):
+    """Return a figure to the pool, dropping it if the pool is already full."""
+    try:
+        _FIG_POOL[tuple(figure_size)].put_nowait((fig, ax))
+    except queue.Full:
+        pass
+
 
 def generate_chart(
-    rows: List[Dict[str, Any]],
+    rows: Union[List[Dict[str, Any]], pd.DataFrame],
     chart_type: str,
     x_column: str,
     y_column: str,
@@ -20,30 +79,34 @@ def generate_chart(
     show_legend: bool = False,
     figure_size: tuple = (10, 6),
     font_size: int = 10,
+    image_format: str = "webp",
+    sink: Optional[BinaryIO] = None,
 ) -> Dict[str, Any]:
-    """Generate a chart from query results and return as PNG bytes.
+    """Generate a chart from query results and return as image bytes.
     
     Args:
-        rows: List of data dictionaries from query
+        rows: List of data dictionaries from query, or a DataFrame of them
         chart_type: Type of chart (bar, line, pie, scatter)
         x_column: Column name for X-axis
         y_column: Column name for Y-axis (numeric)
         title: Optional custom chart title
-        theme: Theme name from CHART_THEMES (default, dark, professional, colorful)
+        theme: Theme name from CHART_THEMES (default, dark)
         color: Override theme color with hex color code
         show_grid: Whether to show grid lines
         show_legend: Whether to show legend
         figure_size: Tuple of (width, height) in inches
         font_size: Base font size for labels
+        image_format: Output encoding from IMAGE_FORMATS (webp, png, svg)
+        sink: Optional binary file to encode the image into. The result then
+            carries the written byte count ("size") instead of "chart_data".
     """
-    import matplotlib
-    matplotlib.use("Agg")  # Non-interactive backend
-    import matplotlib.pyplot as plt
-    
-    if not rows:
+    if len(rows) == 0:
         return {"success": False, "error": "No data to chart"}
+    if image_format not in IMAGE_FORMATS:
+        return {"success": False, "error": f"Unknown image format: {image_format}"}
     
-    df = pd.DataFrame(rows)
+    # Reuse a caller's DataFrame; query rows share the first row's keys
+    df = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame.from_records(rows, columns=list(rows[0]))
     
     # Validate columns exist
     if x_column not in df.columns:
@@ -51,6 +114,10 @@ def generate_chart(
     if y_column not in df.columns:
         return {"success": False, "error": f"Column '{y_column}' not found in data"}
     
+    # Figures are drawn without pyplot so concurrent sessions never share
+    # pyplot's global "current figure"
+    fig, ax = _acquire_figure(figure_size)
+    
     try:
         # Get theme settings
         if theme not in CHART_THEMES:
@@ -58,18 +125,19 @@ def generate_chart(
         theme_config = CHART_THEMES[theme]
         
         # Use override color or theme color
-        chart_color = color or theme_config["color"]
-        bg_color = theme_config["background_color"]
-        use_grid = show_grid and theme_config["grid"]
-        use_legend = show_legend or theme_config["legend"]
-        title_size = theme_config.get("title_size", 14)
+        chart_color = color or theme_config.color
+        bg_color = theme_config.background_color
+        use_grid = show_grid and theme_config.grid
+        use_legend = show_legend or theme_config.legend
+        title_size = theme_config.title_size
         
-        fig, ax = plt.subplots(figsize=figure_size)
         fig.patch.set_facecolor(bg_color)
         ax.set_facecolor(bg_color)
         
-        x_data = df[x_column]
-        y_data = pd.to_numeric(df[y_column], errors="coerce")
+        # Plain arrays so matplotlib skips pandas indexing; float32 is ample
+        # precision for plotting
+        x_data = df[x_column].to_numpy(copy=False)
+        y_data = pd.to_numeric(df[y_column], errors="coerce", downcast="float").to_numpy(copy=False)
         
         chart_title = title or f"{y_column} by {x_column}"
         
@@ -103,29 +171,41 @@ def generate_chart(
         
         # Rotate x labels for better readability
         if chart_type != "pie":
-            plt.xticks(rotation=45, ha="right", fontsize=font_size)
-            plt.yticks(fontsize=font_size)
+            ax.tick_params(axis="x", labelrotation=45, labelsize=font_size)
+            ax.tick_params(axis="y", labelsize=font_size)
+            for label in ax.get_xticklabels():
+                label.set_horizontalalignment("right")
         
-        plt.tight_layout()
+        fig.tight_layout()
         
-        # Save to bytes
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", dpi=150, bbox_inches="tight", facecolor=bg_color)
-        buf.seek(0)
-        chart_data = buf.getvalue()
-        plt.close(fig)
+        mime, extension, save_options = IMAGE_FORMATS[image_format]
+        buf = sink if sink is not None else io.BytesIO()
+        start = buf.tell()
+        if save_options is None:
+            fig.savefig(buf, format=image_format)
+        else:
+            # Render once on the Agg canvas and encode the raw RGBA buffer
+            # directly, skipping savefig's second "tight" render pass
+            fig.canvas.draw()
+            image = Image.frombuffer(
+                "RGBA", fig.canvas.get_width_height(), fig.canvas.buffer_rgba(), "raw", "RGBA", 0, 1
+            )
+            image.save(buf, format=image_format.upper(), **save_options)
+        # Encoding into the caller's sink skips copying the image out of a buffer
+        payload = {"size": buf.tell() - start} if sink is not None else {"chart_data": buf.getvalue()}
         
-        filename = f"chart_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        filename = f"chart_{time.time_ns()}.{extension}"
         
         return {
             "success": True,
-            "chart_data": chart_data,
+            **payload,
             "file_name": filename,
-            "mime": "image/png",
+            "mime": mime,
             "chart_type": chart_type,
             "title": chart_title,
             "theme": theme,
         }
     except Exception as e:
-        plt.close("all")
         return {"success": False, "error": str(e)}
+    finally:
+        _release_figure(fig, ax, figure_size)
@@ -1,20 +1,37 @@
 """Chart theme definitions."""
 
-CHART_THEMES = {
-    "default": {
-        "color": "#4f46e5",
-        "background_color": "white",
-        "grid": True,
-        "legend": False,
-        "font_size": 10,
-        "title_size": 14,
-    },
-    "dark": {
-        "color": "#60a5fa",
-        "background_color": "#1f2937",
-        "grid": True,
-        "legend": False,
-        "font_size": 10,
-        "title_size": 14,
-    },
-}
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+
+@dataclass(frozen=True, slots=True)
+class ThemeConfig:
+    """Styling applied to a chart; read once per generate_chart call."""
+
+    color: str
+    background_color: str
+    grid: bool
+    legend: bool
+    font_size: int = 10
+    title_size: int = 14
+
+
+CHART_THEMES: Mapping[str, ThemeConfig] = MappingProxyType({
+    "default": ThemeConfig(
+        color="#4f46e5",
+        background_color="white",
+        grid=True,
+        legend=False,
+        font_size=10,
+        title_size=14,
+    ),
+    "dark": ThemeConfig(
+        color="#60a5fa",
+        background_color="#1f2937",
+        grid=True,
+        legend=False,
+        font_size=10,
+        title_size=14,
+    ),
+})
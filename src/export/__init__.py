@@ -1,5 +1,5 @@
 """Data export functionality."""
 
-from .exporter import generate_export, export_to_csv, export_to_excel, export_to_pdf
+from .exporter import generate_export, generate_exports, export_to_csv, export_to_excel, export_to_pdf
 
-__all__ = ["generate_export", "export_to_csv", "export_to_excel", "export_to_pdf"]
+__all__ = ["generate_export", "generate_exports", "export_to_csv", "export_to_excel", "export_to_pdf"]
@@ -1,120 +1,284 @@
 """Data export functionality."""
 
+import atexit
 import csv
+import io
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Union
 
 import pandas as pd
+import xlsxwriter
 
 EXPORTS_DIR = Path(__file__).parent.parent.parent / "exports"
 EXPORTS_DIR.mkdir(exist_ok=True)
 
+# Not under the debug-gated chat logger: failed copies are always reported
+logger = logging.getLogger(__name__)
 
-def export_to_csv(rows: List[Dict[str, Any]], filename: Optional[str] = None) -> str:
-    """Export query results to CSV file."""
-    if not rows:
-        raise ValueError("No data to export")
+# Copies of generated exports are persisted off the request path
+_WRITER_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="export-writer")
+atexit.register(_WRITER_POOL.shutdown, wait=True)
+
+# Formats requested together are encoded on their own pool (one worker per
+# format), so background copies never queue behind the response being built
+_FORMAT_POOL = ThreadPoolExecutor(max_workers=3, thread_name_prefix="export-format")
+atexit.register(_FORMAT_POOL.shutdown, wait=True)
+
+# Rows pandas' CSV writer formats per batch when exporting a DataFrame
+CSV_WRITE_CHUNK_ROWS = 10000
+
+# PDF results longer than the threshold are rendered as several smaller tables
+PDF_CHUNK_THRESHOLD = 1000
+PDF_TABLE_CHUNK_ROWS = 500
+
+# ReportLab is optional; PDF exports fall back to HTML without it. Styles and
+# page sizes are per-call constants, so build them once at import.
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    
+    _PDF_TABLE_STYLE = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, 0), 10),
+        ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
+        ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
+        ("GRID", (0, 0), (-1, -1), 1, colors.black),
+    ])
+    _PDF_TITLE_STYLE = getSampleStyleSheet()["Title"]
+    _PDF_SPACER = Spacer(1, 0.3 * inch)
+    _LETTER = letter
+    _LANDSCAPE_LETTER = landscape(letter)
+    _REPORTLAB_AVAILABLE = True
+except ImportError:
+    _REPORTLAB_AVAILABLE = False
+
+# Exporters accept raw query rows or an already-built DataFrame
+Rows = Union[List[Dict[str, Any]], pd.DataFrame]
+
+
+def _as_frame(rows: Rows) -> pd.DataFrame:
+    """Return rows as a DataFrame, reusing it if one was passed in.
+    
+    Query rows all share the first row's keys, so the columns are given up
+    front instead of being collected from every row.
+    """
+    if isinstance(rows, pd.DataFrame):
+        return rows
+    return pd.DataFrame.from_records(rows, columns=list(rows[0])) if rows else pd.DataFrame()
+
+
+def _write_csv_rows(rows: Iterable[Dict[str, Any]], fieldnames: List[str], sink: BinaryIO):
+    """Stream row dicts into a binary sink as UTF-8 CSV, one row at a time."""
+    text = io.TextIOWrapper(sink, encoding="utf-8", newline="", write_through=True)
+    writer = csv.DictWriter(text, fieldnames=fieldnames, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    # Detach so the sink stays open when the wrapper is garbage collected
+    text.detach()
+
+
+def export_to_csv(
+    rows: Union[Rows, Iterable[Dict[str, Any]]],
+    filename: Optional[str] = None,
+    sink: Optional[BinaryIO] = None,
+) -> str:
+    """Export query results to CSV file, or into ``sink`` when given.
+    
+    Row dicts (any iterable, including generators) are streamed straight to
+    the output without building a DataFrame. Returns the written file path,
+    or just the file name when writing to ``sink``.
+    """
+    if isinstance(rows, pd.DataFrame):
+        if rows.empty:
+            raise ValueError("No data to export")
+    else:
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            raise ValueError("No data to export")
+        fieldnames = list(first)
+        rows = chain([first], rows)
     
-    filename = filename or f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    filename = filename or f"export_{time.time_ns()}.csv"
     filepath = EXPORTS_DIR / filename
     
-    with open(filepath, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-        writer.writeheader()
-        writer.writerows(rows)
+    with nullcontext(sink) if sink is not None else open(filepath, "wb", buffering=1 << 20) as f:
+        if isinstance(rows, pd.DataFrame):
+            rows.to_csv(f, index=False, lineterminator="\n", chunksize=CSV_WRITE_CHUNK_ROWS)
+        else:
+            _write_csv_rows(rows, fieldnames, f)
+    
+    return filename if sink is not None else str(filepath)
+
+
+def _write_xlsx(df: pd.DataFrame, target: Union[BinaryIO, Path]):
+    """Stream a DataFrame into an XLSX workbook row by row.
+    
+    constant_memory mode flushes each row as soon as the next one starts, so
+    rows must be written in order; pandas' to_excel writes column by column,
+    hence the direct xlsxwriter loop.
+    """
+    workbook = xlsxwriter.Workbook(
+        target if not isinstance(target, Path) else str(target),
+        {"constant_memory": True, "strings_to_urls": False},
+    )
+    worksheet = workbook.add_worksheet("Results")
+    worksheet.write_row(0, 0, df.columns.tolist(), workbook.add_format({"bold": True}))
+    
+    values = df.astype(object).where(df.notna(), None)
+    for row_idx, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_idx, 0, row)
     
-    return str(filepath)
+    workbook.close()
 
 
-def export_to_excel(rows: List[Dict[str, Any]], filename: Optional[str] = None) -> str:
-    """Export query results to Excel file."""
-    if not rows:
+def export_to_excel(rows: Rows, filename: Optional[str] = None, sink: Optional[BinaryIO] = None) -> str:
+    """Export query results to Excel file, or into ``sink`` when given.
+    
+    Returns the written file path, or just the file name when writing to ``sink``.
+    """
+    df = _as_frame(rows)
+    if df.empty:
         raise ValueError("No data to export")
     
-    filename = filename or f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    filepath = EXPORTS_DIR / filename
+    filename = filename or f"export_{time.time_ns()}.xlsx"
     
-    pd.DataFrame(rows).to_excel(filepath, index=False, engine="openpyxl")
-    return str(filepath)
+    target = sink if sink is not None else EXPORTS_DIR / filename
+    _write_xlsx(df, target)
+    return filename if sink is not None else str(target)
 
 
-def export_to_pdf(rows: List[Dict[str, Any]], filename: Optional[str] = None) -> str:
-    """Export query results to PDF file."""
-    if not rows:
+def export_to_pdf(rows: Rows, filename: Optional[str] = None, sink: Optional[BinaryIO] = None) -> str:
+    """Export query results to PDF file, or into ``sink`` when given.
+    
+    Falls back to HTML when ReportLab is not installed. Returns the written
+    file path, or just the file name when writing to ``sink``.
+    """
+    df = _as_frame(rows)
+    if df.empty:
         raise ValueError("No data to export")
     
-    filename = filename or f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    filename = filename or f"export_{time.time_ns()}.pdf"
     filepath = EXPORTS_DIR / filename
-    df = pd.DataFrame(rows)
     
-    try:
-        from reportlab.lib.pagesizes import letter, landscape
-        from reportlab.lib import colors
-        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib.units import inch
-        
-        page_size = landscape(letter) if len(df.columns) > 6 else letter
-        doc = SimpleDocTemplate(str(filepath), pagesize=page_size)
-        
-        data = [list(df.columns)] + df.values.tolist()
-        table = Table(data)
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-            ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
-            ("FONTSIZE", (0, 0), (-1, 0), 10),
-            ("BOTTOMPADDING", (0, 0), (-1, 0), 12),
-            ("BACKGROUND", (0, 1), (-1, -1), colors.beige),
-            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        
-        elements = [
-            Paragraph("Query Results", getSampleStyleSheet()["Title"]),
-            Spacer(1, 0.3 * inch),
-            table,
-        ]
-        doc.build(elements)
-        
-    except ImportError:
+    if not _REPORTLAB_AVAILABLE:
         html_path = filepath.with_suffix(".html")
+        if sink is not None:
+            sink.write(df.to_html(index=False).encode("utf-8"))
+            return html_path.name
         df.to_html(html_path, index=False)
         return str(html_path)
     
-    return str(filepath)
+    page_size = _LANDSCAPE_LETTER if len(df.columns) > 6 else _LETTER
+    doc = SimpleDocTemplate(sink if sink is not None else str(filepath), pagesize=page_size)
+    
+    elements = [
+        Paragraph("Query Results", _PDF_TITLE_STYLE),
+        _PDF_SPACER,
+    ]
+    
+    # Large results are split into several tables, each stringified in one
+    # vectorized pass, so only one chunk of cell text exists at a time; the
+    # header repeats on every page a table spans
+    header = df.columns.tolist()
+    step = PDF_TABLE_CHUNK_ROWS if len(df) > PDF_CHUNK_THRESHOLD else len(df)
+    for start in range(0, len(df), step):
+        cells = df.iloc[start:start + step].fillna("").astype(str)
+        table = Table([header] + cells.to_numpy().tolist(), repeatRows=1)
+        table.setStyle(_PDF_TABLE_STYLE)
+        elements.append(table)
+    
+    doc.build(elements)
+    
+    return filename if sink is not None else str(filepath)
+
 
+# Export format -> (exporter, mime type)
+_EXPORTERS = {
+    "csv": (export_to_csv, "text/csv"),
+    "excel": (export_to_excel, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": (export_to_pdf, "application/pdf"),
+}
+
+
+def _write_atomic(filepath: Path, data: bytes):
+    """Write data next to filepath and rename it into place."""
+    tmp_path = filepath.with_name(filepath.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except OSError:
+        # Don't leave a partial copy behind, e.g. when the disk is full
+        tmp_path.unlink(missing_ok=True)
+        raise
 
-def generate_export(rows: List[Dict[str, Any]], fmt: str) -> Dict[str, Any]:
-    """Generate export file and return file data."""
-    if not rows:
-        return {"success": False, "error": "No data to export"}
+
+def _log_write_failure(future: Future):
+    """Log a failed background export copy; nothing else waits on the future."""
+    error = future.exception()
+    if error is not None:
+        logger.error("export_write_failed", exc_info=error)
+
+
+def generate_export(rows: Rows, fmt: str) -> Dict[str, Any]:
+    """Generate export file in memory and return file data."""
+    entry = _EXPORTERS.get(fmt)
+    if entry is None:
+        return {"success": False, "error": f"Unknown format: {fmt}"}
+    export_fn, mime = entry
     
     try:
-        exporters = {
-            "csv": (export_to_csv, "text/csv"),
-            "excel": (export_to_excel, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
-            "pdf": (export_to_pdf, "application/pdf"),
-        }
-        
-        if fmt not in exporters:
-            return {"success": False, "error": f"Unknown format: {fmt}"}
+        # CSV streams row dicts directly; the other formats need a DataFrame
+        data = rows if fmt == "csv" and not isinstance(rows, pd.DataFrame) else _as_frame(rows)
+        if (data.empty if isinstance(data, pd.DataFrame) else not data):
+            return {"success": False, "error": "No data to export"}
         
-        export_fn, mime = exporters[fmt]
-        filepath = export_fn(rows)
+        buf = io.BytesIO()
+        file_name = export_fn(data, sink=buf)
         
-        if filepath.endswith(".html"):
+        if file_name.endswith(".html"):
             mime = "text/html"
         
-        with open(filepath, "rb") as f:
-            file_data = f.read()
+        # Keep an on-disk copy without blocking the response
+        file_data = buf.getvalue()
+        _WRITER_POOL.submit(_write_atomic, EXPORTS_DIR / file_name, file_data).add_done_callback(_log_write_failure)
         
         return {
             "success": True,
             "file_data": file_data,
-            "file_name": Path(filepath).name,
+            "file_name": file_name,
             "mime": mime,
         }
     except Exception as e:
         return {"success": False, "error": str(e)}
+
+
+def generate_exports(rows: Rows, fmts: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Generate several export formats concurrently from one shared DataFrame.
+    
+    Returns the generate_export result for each requested format.
+    """
+    fmts = list(dict.fromkeys(fmts))
+    try:
+        df = _as_frame(rows)
+    except Exception as e:
+        return {fmt: {"success": False, "error": str(e)} for fmt in fmts}
+    if len(fmts) == 1:
+        return {fmts[0]: generate_export(df, fmts[0])}
+    
+    futures = {fmt: _FORMAT_POOL.submit(generate_export, df, fmt) for fmt in fmts}
+    wait(futures.values())
+    return {fmt: future.result() for fmt, future in futures.items()}
@@ -1,6 +1,24 @@
 """LLM module for AI-powered query processing and tool calling."""
 
-from .core import run_llm, format_sql_results
+from .core import (
+    run_llm,
+    arun_llm,
+    llm_raw_reply,
+    route_llm_reply,
+    format_sql_results,
+    aformat_sql_results,
+    clear_retrieval_cache,
+)
 from .tools import EXPORT_TOOLS, CHART_TOOLS
 
-__all__ = ["run_llm", "format_sql_results", "EXPORT_TOOLS", "CHART_TOOLS"]
+__all__ = [
+    "run_llm",
+    "arun_llm",
+    "llm_raw_reply",
+    "route_llm_reply",
+    "format_sql_results",
+    "aformat_sql_results",
+    "clear_retrieval_cache",
+    "EXPORT_TOOLS",
+    "CHART_TOOLS",
+]
@@ -0,0 +1,134 @@
+"""Batch prompting: coalesce concurrent queries into one chat model call."""
+
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Optional
+
+import orjson
+
+Messages = List[Dict[str, str]]
+
+BATCH_PROMPT = """You will receive several numbered questions, each with its own schema block.
+Answer every question independently, following the rules above for each one.
+Respond with a JSON object {"responses": [...]} holding exactly one response object per question, in the same order."""
+
+
+class QueryBatcher:
+    """Collect queries arriving within a short window and answer them with one LLM call.
+    
+    Each caller passes the messages it would have sent on its own
+    ([system prompt, schema block, user query]) and blocks until its own raw
+    JSON reply is available. A window holding a single query is sent
+    unchanged; if a batched reply can't be split back per question, each
+    query is retried on its own. Replies are wrapped in an object rather
+    than a bare array so batches work with structured response formats.
+    
+    Only queries submitted with the same batch key share a call, so one
+    user's question, schema and columns never sit in the context of
+    another's. Queries without a key are always sent on their own.
+    """
+    
+    def __init__(
+        self,
+        invoke: Callable[[Messages], str],
+        window_seconds: float,
+        max_size: int = 8,
+        invoke_batch: Optional[Callable[[Messages], str]] = None,
+    ):
+        self._invoke = invoke
+        # Batched prompts may need a different response format than single ones
+        self._invoke_batch = invoke_batch or invoke
+        self._window = window_seconds
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # Batch key -> queued (messages, future) pairs and the window's timer
+        self._pending: Dict[Hashable, List[tuple]] = {}
+        self._timers: Dict[Hashable, threading.Timer] = {}
+    
+    def submit(self, messages: Messages, batch_key: Optional[Hashable] = None) -> str:
+        """Queue messages for the next batch of batch_key and return the raw reply for them."""
+        if batch_key is None:
+            return self._invoke(messages)
+        
+        future: Future = Future()
+        batch = None
+        
+        with self._lock:
+            pending = self._pending.setdefault(batch_key, [])
+            pending.append((messages, future))
+            if len(pending) >= self._max_size:
+                batch = self._take_pending(batch_key)
+            elif len(pending) == 1:
+                timer = threading.Timer(self._window, self._flush, args=(batch_key,))
+                timer.daemon = True
+                self._timers[batch_key] = timer
+                timer.start()
+        
+        # A full batch is answered on the thread that filled it
+        if batch:
+            self._run(batch)
+        return future.result()
+    
+    def _take_pending(self, batch_key: Hashable) -> List[tuple]:
+        """Detach the pending batch of batch_key; must be called with the lock held."""
+        batch = self._pending.pop(batch_key, [])
+        timer = self._timers.pop(batch_key, None)
+        if timer is not None:
+            timer.cancel()
+        return batch
+    
+    def _flush(self, batch_key: Hashable):
+        with self._lock:
+            batch = self._take_pending(batch_key)
+        if batch:
+            self._run(batch)
+    
+    def _run(self, batch: List[tuple]):
+        if len(batch) == 1:
+            messages, future = batch[0]
+            self._resolve(future, messages)
+            return
+        
+        try:
+            replies = self._split(self._invoke_batch(self._batch_messages(batch)), len(batch))
+        except Exception:
+            replies = None
+        
+        if replies is None:
+            for messages, future in batch:
+                self._resolve(future, messages)
+            return
+        
+        for (_, future), reply in zip(batch, replies):
+            future.set_result(reply)
+    
+    def _resolve(self, future: Future, messages: Messages):
+        try:
+            future.set_result(self._invoke(messages))
+        except Exception as e:
+            future.set_exception(e)
+    
+    @staticmethod
+    def _batch_messages(batch: List[tuple]) -> Messages:
+        """Number each query and tag it with its own schema block."""
+        system_prompt = batch[0][0][0]["content"]
+        questions = "\n\n".join(
+            f"### Question {i}\n{messages[1]['content']}\n\nQuestion: {messages[2]['content']}"
+            for i, (messages, _) in enumerate(batch, start=1)
+        )
+        return [
+            {"role": "system", "content": f"{system_prompt}\n\n{BATCH_PROMPT}"},
+            {"role": "user", "content": questions},
+        ]
+    
+    @staticmethod
+    def _split(raw: str, expected: int) -> Optional[List[str]]:
+        """Split a batched {"responses": [...]} reply into one raw JSON reply per question."""
+        try:
+            parsed = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            return None
+        responses = parsed.get("responses") if isinstance(parsed, dict) else None
+        if not isinstance(responses, list) or len(responses) != expected:
+            return None
+        return [orjson.dumps(item).decode() for item in responses]
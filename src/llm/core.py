@@ -1,120 +1,426 @@
 """LLM core functionality."""
 
-import json
+import asyncio
 import os
-from typing import Any, Dict, List, Optional
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
 
+import numpy as np
+import orjson
+import pandas as pd
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
+from langchain_classic.embeddings import CacheBackedEmbeddings
+from langchain_classic.storage import LocalFileStore
+from langchain_core.documents import Document
 from langchain_pinecone import PineconeVectorStore
 from langchain_openai import OpenAIEmbeddings
 
 from src.export import generate_export
-from src.charts import generate_chart, CHART_THEMES
-from .tools import EXPORT_TOOLS, CHART_TOOLS
+from src.charts import CHART_THEMES, generate_chart
+from src.query import load_schema_ddl, sanitize_rows
+from .batching import QueryBatcher
+from .tools import RESPONSE_FORMAT, BATCH_RESPONSE_FORMAT
 
 load_dotenv()
 
+EMBED_CACHE_DIR = Path(__file__).parent.parent.parent / "data" / ".embed_cache"
+
+# Cached query embeddings kept on disk; the oldest are pruned at startup
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000"))
+
+# Number of schema docs retrieved per question
+SCHEMA_TOP_K = 4
+
+# Upper bound on schema text placed in the prompt
+MAX_SCHEMA_CHARS = 8000
+
+# Retrieved schema docs are reused for repeated questions within this window
+RETRIEVAL_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_TTL = 3600  # seconds
+
+# Cosine similarity above which a new question reuses a cached question's docs
+RETRIEVAL_SIMILARITY_THRESHOLD = 0.95
+
+# Results with at most this many rows are shown as-is without an LLM summary
+SUMMARIZE_THRESHOLD = int(os.getenv("SUMMARIZE_THRESHOLD", "20"))
+
+# Rows of a larger result sent to the LLM to narrate
+SUMMARY_SAMPLE_ROWS = 20
+
+# Queries arriving within this window share one batched LLM call (0 disables batching)
+LLM_BATCH_WINDOW_MS = int(os.getenv("LLM_BATCH_WINDOW_MS", "0"))
+LLM_BATCH_MAX = 8
+
+# Shortened text-embedding-3 vectors; must match the Pinecone index dimension
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "512"))
+
 # Initialize embeddings and vector store
-embeddings = OpenAIEmbeddings(
+_openai_embeddings = OpenAIEmbeddings(
     model="text-embedding-3-small",
+    dimensions=EMBEDDING_DIMENSIONS,
     show_progress_bar=False,
     chunk_size=50,
     retry_min_seconds=10,
 )
 
-vector_store = PineconeVectorStore(
-    index_name=os.getenv("INDEX_NAME"),
-    embedding=embeddings,
+
+def _prune_embed_cache(active_dir: Path, max_entries: int):
+    """Drop cached vectors of other models/dimensions and the least recently used over max_entries."""
+    if EMBED_CACHE_DIR.is_dir():
+        for entry in EMBED_CACHE_DIR.iterdir():
+            if entry == active_dir:
+                continue
+            # Vectors from another model or dimension can never be served again
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+    
+    if not active_dir.is_dir():
+        return
+    # The store bumps access times on reads, so the least recently used go first
+    files = sorted((f for f in active_dir.iterdir() if f.is_file()), key=lambda f: f.stat().st_atime)
+    for stale in files[:max(0, len(files) - max_entries)]:
+        stale.unlink(missing_ok=True)
+
+
+# Query embeddings are cached on disk so repeated questions skip the OpenAI call,
+# including across restarts. Each model/dimension pair has its own directory.
+_EMBED_NAMESPACE = f"{_openai_embeddings.model}-{EMBEDDING_DIMENSIONS}"
+_EMBED_CACHE_NAMESPACE_DIR = EMBED_CACHE_DIR / _EMBED_NAMESPACE
+_prune_embed_cache(_EMBED_CACHE_NAMESPACE_DIR, EMBED_CACHE_MAX_ENTRIES)
+
+embeddings = CacheBackedEmbeddings.from_bytes_store(
+    _openai_embeddings,
+    LocalFileStore(str(_EMBED_CACHE_NAMESPACE_DIR), update_atime=True),
+    namespace=_EMBED_NAMESPACE,
+    query_embedding_cache=True,
 )
 
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> PineconeVectorStore:
+    """Connect to the Pinecone index on first use and reuse it for the process.
+    
+    Connecting resolves the index over the network, so it is deferred until a
+    query actually needs retrieval; small schemas sent whole never pay it.
+    """
+    return PineconeVectorStore(
+        index_name=os.getenv("INDEX_NAME"),
+        embedding=embeddings,
+    )
+
+
+# Optional OpenAI service tier (e.g. "priority" for lower latency); unset uses the account default
+LLM_LATENCY_TIER = os.getenv("LLM_LATENCY_TIER")
+
 # Initialize chat model
 chat_model = init_chat_model(
     model="gpt-5.2",
     model_provider="openai",
+    **({"service_tier": LLM_LATENCY_TIER} if LLM_LATENCY_TIER else {}),
 )
 
+# run_llm replies must match RESPONSE_SCHEMA, enforced by constrained decoding.
+# Every run_llm prompt opens with the same static system message followed by
+# the schema block, so a shared prompt_cache_key routes them to the same
+# prompt cache instead of scattering that prefix across cache shards.
+json_chat_model = chat_model.bind(response_format=RESPONSE_FORMAT, prompt_cache_key="schemasense-run-llm")
+batch_chat_model = chat_model.bind(response_format=BATCH_RESPONSE_FORMAT, prompt_cache_key="schemasense-run-llm-batch")
 
-def _get_llm_response(content: Any) -> str:
-    """Extract string content from LLM response."""
-    if isinstance(content, list):
-        return str(content[0]) if content else ""
-    return str(content)
 
+# Theme names offered to the model, kept in sync with the themes that exist
+_THEME_CHOICES = " | ".join(f'"{name}"' for name in CHART_THEMES)
 
-def run_llm(query: str, last_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-    """
-    Process user query using LLM with tool calling for exports and charts.
-    
-    The LLM decides whether to:
-    1. Generate SQL for data queries
-    2. Call export_data tool for export requests
-    3. Generate SQL AND export in one go
-    4. Create charts from data
-    5. Provide a direct answer
-    """
-    # Retrieve schema context
-    docs = vector_store.as_retriever(k=4).invoke(query)
-    schema_context = "\n\n".join(doc.page_content for doc in docs)
-    
-    # Build system prompt
-    has_data = bool(last_results)
-    
-    # Get available columns from last results for chart generation
-    available_columns = list(last_results[0].keys()) if has_data and last_results else []
-    columns_info = f"Available columns in current data: {available_columns}" if available_columns else ""
-    
-    system_prompt = f"""You are an expert SQLite SQL generator and data assistant.
+SYSTEM_PROMPT = """You are an expert SQLite SQL generator and data assistant.
 
 You MUST respond in valid JSON only. No markdown, no explanations outside JSON.
 
 For data queries, respond with:
-{{"type": "sql", "sql": "<SELECT QUERY>"}}
+{"type": "sql", "sql": "<SELECT QUERY>"}
 
 For data queries where the user ALSO wants to export/download the results (e.g., "give me categories as CSV", "show products and export as PDF"), respond with:
-{{"type": "sql_and_export", "sql": "<SELECT QUERY>", "format": "csv" | "excel" | "pdf"}}
+{"type": "sql_and_export", "sql": "<SELECT QUERY>", "format": "csv" | "excel" | "pdf" | ["csv", "excel", ...]}
 
 For data queries where the user wants to visualize/chart the results (e.g., "show me products as a bar chart", "graph sales by category"), respond with:
-{{"type": "sql_and_chart", "sql": "<SELECT QUERY>", "chart_type": "bar" | "line" | "pie" | "scatter", "x_column": "<column>", "y_column": "<column>", "title": "<optional title>", "theme": "default" | "dark" | "professional" | "colorful"}}
+{"type": "sql_and_chart", "sql": "<SELECT QUERY>", "chart_type": "bar" | "line" | "pie" | "scatter", "x_column": "<column>", "y_column": "<column>", "title": "<optional title>", "theme": THEME_CHOICES}
 
-{"For chart requests when you already have data:" if has_data else ""}
-{'{{"type": "chart", "chart_type": "bar" | "line" | "pie" | "scatter", "x_column": "<column>", "y_column": "<column>", "title": "<optional title>", "theme": "default" | "dark" | "professional" | "colorful"}}' if has_data else ""}
-{columns_info}
+For chart requests when you already have data (available columns are listed after the schema):
+{"type": "chart", "chart_type": "bar" | "line" | "pie" | "scatter", "x_column": "<column>", "y_column": "<column>", "title": "<optional title>", "theme": THEME_CHOICES}
 
-{"For export requests when you already have data, respond with:" if has_data else ""}
-{'{{"type": "export", "format": "csv" | "excel" | "pdf"}}' if has_data else ""}
+For export requests when you already have data, respond with:
+{"type": "export", "format": "csv" | "excel" | "pdf"}
 
 For questions or impossible queries, respond with:
-{{"type": "message", "content": "<response>"}}
+{"type": "message", "content": "<response>"}
 
 Rules:
 - Use ONLY tables/columns from the provided schema
 - SQL must be SELECT-only and SQLite compatible  
 - Never invent tables or columns
+- Only use "chart" or "export" when current data columns are listed
 - If user asks for data AND wants to download/export/save it, use "sql_and_export" type
 - If user asks for data AND wants to visualize/chart/graph it, use "sql_and_chart" type
 - For charts, x_column should be categorical (names, labels), y_column should be numeric
 - Supported export formats: csv, excel, pdf
-- Supported chart types: bar, line, pie, scatter"""
+- If user wants the same data in several formats, give "format" as a list of formats
+- Supported chart types: bar, line, pie, scatter""".replace("THEME_CHOICES", _THEME_CHOICES)
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Schema:\n{schema_context}\n\nQuestion: {query}"},
-    ]
+# Per-query schema message, sent after the static SYSTEM_PROMPT
+SCHEMA_MESSAGE_TEMPLATE = "Schema:\n{schema_context}\n\n{columns_info}"
+COLUMNS_INFO_TEMPLATE = "Available columns in current data: {columns}"
+NO_DATA_INFO = "No current data."
+
+FORMATTER_PROMPT = """You are a helpful data analyst. Present the query results clearly and conversationally.
+Always end by asking: "Would you like me to save this as CSV, Excel, or PDF?"
+Do NOT respond in JSON - just write a natural message."""
+
+SMALL_RESULT_MESSAGE = "Here are the {count} results for your question. Would you like me to save this as CSV, Excel, or PDF?"
+
+
+def _get_llm_response(content: Any) -> str:
+    """Extract string content from LLM response."""
+    if isinstance(content, list):
+        return str(content[0]) if content else ""
+    return str(content)
+
+
+def _invoke_raw(messages: List[Dict[str, str]]) -> str:
+    """Send messages to the structured-output chat model and return its stripped text reply."""
+    return _get_llm_response(json_chat_model.invoke(messages).content).strip()
+
+
+def _invoke_batch_raw(messages: List[Dict[str, str]]) -> str:
+    """Send a batched prompt and return the raw {"responses": [...]} reply."""
+    return _get_llm_response(batch_chat_model.invoke(messages).content).strip()
+
+
+_query_batcher = (
+    QueryBatcher(_invoke_raw, LLM_BATCH_WINDOW_MS / 1000, LLM_BATCH_MAX, invoke_batch=_invoke_batch_raw)
+    if LLM_BATCH_WINDOW_MS > 0
+    else None
+)
+
+
+# normalized query -> (timestamp, query embedding, docs)
+_retrieval_cache: "OrderedDict[str, Tuple[float, np.ndarray, List[Document]]]" = OrderedDict()
+_retrieval_lock = threading.Lock()
+
+
+# Whole-schema doc for databases small enough to skip retrieval; None until loaded
+_full_schema_docs: Optional[List[Document]] = None
+
+
+def clear_retrieval_cache():
+    """Drop cached schema retrievals, e.g. after the vector index was re-ingested."""
+    global _full_schema_docs
+    with _retrieval_lock:
+        _retrieval_cache.clear()
+        _full_schema_docs = None
+
+
+def _get_full_schema_docs() -> List[Document]:
+    """Return the whole database schema as a single doc if it fits in the prompt, else [].
     
-    response = chat_model.invoke(messages)
-    raw = _get_llm_response(response.content).strip()
+    Small schemas (like the Northwind example) are sent whole, so every
+    question shares one byte-identical schema message and skips retrieval.
+    """
+    global _full_schema_docs
+    if _full_schema_docs is None:
+        ddl = load_schema_ddl()
+        fits = bool(ddl) and len(ddl) <= MAX_SCHEMA_CHARS
+        _full_schema_docs = [Document(page_content=ddl, metadata={"source": "sqlite_master"})] if fits else []
+    return _full_schema_docs
+
+
+def _schema_docs(query: str, retrieve: bool = True) -> List[Document]:
+    """Schema docs for a query: the full schema when it fits, otherwise retrieved docs.
+    
+    With ``retrieve=False`` a schema too large to send whole is left out
+    instead of being retrieved; the full schema is always included.
+    """
+    full = _get_full_schema_docs()
+    if full or not retrieve:
+        return full
+    return _sort_docs(_retrieve_schema_docs(query))
+
+
+def _find_similar_docs(query_vector: np.ndarray, now: float) -> Optional[List[Document]]:
+    """Return cached docs for the most similar recent question, if it is close enough.
+    
+    Must be called with _retrieval_lock held.
+    """
+    fresh = [entry for entry in _retrieval_cache.values() if now - entry[0] < RETRIEVAL_CACHE_TTL]
+    if not fresh:
+        return None
+    
+    # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+    scores = np.stack([entry[1] for entry in fresh]) @ query_vector
+    best = int(np.argmax(scores))
+    return fresh[best][2] if scores[best] >= RETRIEVAL_SIMILARITY_THRESHOLD else None
+
+
+def _normalize_query(query: str) -> str:
+    """Normalize a query so trivially different phrasings share cache entries."""
+    return " ".join(query.lower().split())
+
+
+def _retrieve_schema_docs(query: str) -> List[Document]:
+    """Retrieve schema docs for a query, reusing recent results for repeated or near-duplicate questions."""
+    key = _normalize_query(query)
+    now = time.monotonic()
     
+    with _retrieval_lock:
+        cached = _retrieval_cache.get(key)
+        if cached and now - cached[0] < RETRIEVAL_CACHE_TTL:
+            _retrieval_cache.move_to_end(key)
+            return cached[2]
+    
+    # Embed once (hits the embedding cache for repeats) and search by vector,
+    # instead of building a new retriever object per call
+    query_vector = np.asarray(embeddings.embed_query(key), dtype=np.float32)
+    
+    with _retrieval_lock:
+        docs = _find_similar_docs(query_vector, now)
+    if docs is None:
+        docs = get_vector_store().similarity_search_by_vector(query_vector.tolist(), k=SCHEMA_TOP_K)
+    
+    with _retrieval_lock:
+        _retrieval_cache[key] = (now, query_vector, docs)
+        _retrieval_cache.move_to_end(key)
+        while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+            _retrieval_cache.popitem(last=False)
+    
+    return docs
+
+
+def _export_formats(value: Any) -> List[str]:
+    """Normalize the LLM's export format, which may be a single format or a list."""
+    if isinstance(value, str):
+        return [value]
+    formats = [fmt for fmt in value or [] if isinstance(fmt, str)]
+    return formats or ["csv"]
+
+
+def _sort_docs(docs: List[Document]) -> List[Document]:
+    """Order docs deterministically so identical retrievals produce identical prompts."""
+    return sorted(docs, key=lambda doc: (doc.id or "", doc.page_content))
+
+
+def _build_schema_context(docs: List[Document]) -> str:
+    """Join schema docs into prompt text, dropping duplicate chunks and capping its length."""
+    return _join_schema(tuple(doc.page_content for doc in docs))
+
+
+@lru_cache(maxsize=256)
+def _join_schema(contents: Tuple[str, ...]) -> str:
+    """Memoized join: the same retrieved docs come back for most schema questions."""
+    return "\n\n".join(dict.fromkeys(contents))[:MAX_SCHEMA_CHARS]
+
+
+# Requests like "export this as CSV" or "download the results as a PDF"
+_RE_FAST_EXPORT = re.compile(
+    r"(?:please\s+)?(?:export|download|save)"
+    r"(?:\s+(?:it|this|that|them|these|(?:the\s+)?(?:last\s+|current\s+)?(?:results?|data|table)))?"
+    r"\s+(?:as|to|in(?:to)?)\s+(?:an?\s+)?(csv|excel|xlsx|pdf)(?:\s+file)?\s*[.!]?",
+    re.IGNORECASE,
+)
+_FAST_EXPORT_FORMATS = {"csv": "csv", "excel": "excel", "xlsx": "excel", "pdf": "pdf"}
+
+
+def _try_fast_path(query: str, last_results: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+    """Answer unambiguous requests locally, without retrieval or an LLM call.
+    
+    Returns the raw JSON reply the model would have given. Only bare "export the current results as <format>" requests qualify; the
+    whole query must match, so anything that also asks for new data (or a
+    chart, whose axes the model picks) still goes to the LLM.
+    """
+    if not last_results:
+        return None
+    
+    match = _RE_FAST_EXPORT.fullmatch(query.strip())
+    if not match:
+        return None
+    
+    return orjson.dumps({"type": "export", "format": _FAST_EXPORT_FORMATS[match.group(1).lower()]}).decode()
+
+
+# Short follow-ups about the current results ("plot it as a pie chart",
+# "make that a line graph", "export these") need no schema retrieval
+_RE_RESULTS_FOLLOW_UP = re.compile(
+    r"(?=.*\b(?:chart|graph|plot|visuali[sz]e|export|download|save)\b)"
+    r"(?=.*\b(?:it|this|that|these|those|them|the\s+(?:results?|data|table))\b)",
+    re.IGNORECASE,
+)
+FOLLOW_UP_MAX_WORDS = 6
+
+
+def _needs_retrieval(query: str, last_results: Optional[List[Dict[str, Any]]]) -> bool:
+    """Whether a query may need SQL, and therefore retrieved schema docs.
+    
+    Only short chart/export follow-ups that refer back to the current
+    results skip vector-store retrieval; the model answers those from the
+    column list. A full schema that fits the prompt is still sent, keeping
+    the cached system/schema prefix identical across questions.
+    """
+    if not last_results or len(query.split()) > FOLLOW_UP_MAX_WORDS:
+        return True
+    return not _RE_RESULTS_FOLLOW_UP.match(query)
+
+
+def _build_messages(query: str, docs: List[Document], last_results: Optional[List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """Assemble the chat messages for a query from its retrieved schema docs."""
+    schema_context = _build_schema_context(docs)
+    
+    # Available columns from last results let the model pick chart axes
+    columns_info = COLUMNS_INFO_TEMPLATE.format(columns=list(last_results[0])) if last_results else NO_DATA_INFO
+    
+    # Static instructions first, then the schema block, then the short query,
+    # so repeated requests share the longest possible prompt prefix.
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": SCHEMA_MESSAGE_TEMPLATE.format(schema_context=schema_context, columns_info=columns_info)},
+        {"role": "user", "content": query},
+    ]
+
+
+def _route_response(raw: str, docs: List[Document], last_results: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Turn the model's raw reply into a run_llm result, running exports and charts."""
+    # Plain-text replies can't be JSON objects, so skip the parser for them
+    if not raw.startswith("{"):
+        return {"type": "answer", "answer": raw, "content": docs}
+    
+    # Structured outputs make this a guard against truncated or refused replies only
     try:
-        parsed = json.loads(raw)
-    except json.JSONDecodeError:
+        parsed = orjson.loads(raw)
+    except orjson.JSONDecodeError:
         return {"type": "answer", "answer": raw, "content": docs}
     
+    # The schema sends unused fields as null; drop them so .get() defaults apply
+    parsed = {key: value for key, value in parsed.items() if value is not None}
+    return _route_parsed(parsed, raw, docs, last_results)
+
+
+def _route_parsed(
+    parsed: Dict[str, Any],
+    raw: str,
+    docs: List[Document],
+    last_results: Optional[List[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """Dispatch a parsed response object to its export/chart/SQL/answer branch."""
+    has_data = bool(last_results)
     resp_type = parsed.get("type")
     
     # Handle export request when we have data
     if resp_type == "export" and has_data:
-        fmt = parsed.get("format", "csv")
+        fmt = _export_formats(parsed.get("format"))[0]
         result = generate_export(last_results, fmt)
         if result["success"]:
             return {
@@ -153,6 +459,14 @@ Rules:
             "answer": f"Sorry, I couldn't generate the chart: {result['error']}",
         }
     
+    # Export/chart requested before any query has produced data
+    if resp_type in ("export", "chart"):
+        return {
+            "type": "answer",
+            "answer": "There are no results to work with yet. Ask a data question first.",
+            "content": docs,
+        }
+    
     # Handle SQL + chart combined request
     if resp_type == "sql_and_chart":
         return {
@@ -171,7 +485,7 @@ Rules:
         return {
             "type": "sql_and_export",
             "sql": parsed.get("sql"),
-            "export_format": parsed.get("format", "csv"),
+            "export_formats": _export_formats(parsed.get("format")),
             "content": docs,
         }
     
@@ -190,31 +504,136 @@ Rules:
     }
 
 
+def llm_raw_reply(
+    query: str,
+    last_results: Optional[List[Dict[str, Any]]] = None,
+    batch_key: Optional[Hashable] = None,
+) -> Tuple[str, List[Document]]:
+    """Return the model's raw reply to a query and the schema docs it was given.
+    
+    Nothing is rendered here, so the result depends only on the query and the
+    current results and is safe to memoize; route_llm_reply turns it into a
+    run_llm result. Plain export requests for the current results skip the
+    LLM entirely. With LLM_BATCH_WINDOW_MS set, queries sharing a
+    ``batch_key`` (e.g. one user session) may be answered by one batched
+    call; queries without one are always sent alone.
+    """
+    fast = _try_fast_path(query, last_results)
+    if fast is not None:
+        return fast, []
+    
+    docs = _schema_docs(query, _needs_retrieval(query, last_results))
+    messages = _build_messages(query, docs, last_results)
+    raw = _query_batcher.submit(messages, batch_key) if _query_batcher else _invoke_raw(messages)
+    return raw, docs
+
+
+def route_llm_reply(
+    raw: str,
+    docs: List[Document],
+    last_results: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """Turn a raw reply from llm_raw_reply into a run_llm result, rendering exports and charts."""
+    return _route_response(raw, docs, last_results)
+
+
+def run_llm(
+    query: str,
+    last_results: Optional[List[Dict[str, Any]]] = None,
+    batch_key: Optional[Hashable] = None,
+) -> Dict[str, Any]:
+    """
+    Process user query using LLM with tool calling for exports and charts.
+    
+    The LLM decides whether to:
+    1. Generate SQL for data queries
+    2. Call export_data tool for export requests
+    3. Generate SQL AND export in one go
+    4. Create charts from data
+    5. Provide a direct answer
+    
+    See llm_raw_reply for the fast path and batching.
+    """
+    raw, docs = llm_raw_reply(query, last_results, batch_key)
+    return _route_response(raw, docs, last_results)
+
+
+async def arun_llm(query: str, last_results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Async variant of run_llm for front-ends running an event loop.
+    
+    Retrieval and export/chart rendering run in worker threads, and the model
+    call uses ainvoke, so the loop is never blocked.
+    """
+    fast = await asyncio.to_thread(_try_fast_path, query, last_results)
+    if fast is not None:
+        return await asyncio.to_thread(_route_response, fast, [], last_results)
+    
+    docs = await asyncio.to_thread(_schema_docs, query, _needs_retrieval(query, last_results))
+    response = await json_chat_model.ainvoke(_build_messages(query, docs, last_results))
+    raw = _get_llm_response(response.content).strip()
+    return await asyncio.to_thread(_route_response, raw, docs, last_results)
+
+
+def _numeric_stats(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Min, max and mean of each numeric column across all rows."""
+    stats = pd.DataFrame(rows).select_dtypes("number").agg(["min", "max", "mean"])
+    return {
+        col: {stat: round(float(value), 4) for stat, value in values.items()}
+        for col, values in stats.items()
+    }
+
+
+def _summary_messages(original_query: str, sql: str, safe_rows: List[Dict[str, Any]]) -> Optional[List[Dict[str, str]]]:
+    """Build the formatter prompt, or None when the result is small enough to show as-is."""
+    # The chat message draws the rows as a table, so small results need no narration
+    if len(safe_rows) <= SUMMARIZE_THRESHOLD:
+        return None
+    
+    summary = {
+        "total_rows": len(safe_rows),
+        "columns": list(safe_rows[0].keys()),
+        "numeric_stats": _numeric_stats(safe_rows),
+    }
+    preview = orjson.dumps(safe_rows[:SUMMARY_SAMPLE_ROWS], default=str).decode()
+    
+    return [
+        {"role": "system", "content": FORMATTER_PROMPT},
+        {"role": "user", "content": (
+            f"Question: {original_query}\nSQL: {sql}\n"
+            f"Results truncated to first {SUMMARY_SAMPLE_ROWS} rows; full count is {len(safe_rows)}.\n"
+            f"Summary: {orjson.dumps(summary).decode()}\n"
+            f"Results:\n{preview}"
+        )},
+    ]
+
+
 def format_sql_results(original_query: str, sql: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Format SQL results using LLM for natural language presentation."""
     if not rows:
         return {"message": "The query returned no results.", "rows": []}
     
-    def sanitize(val):
-        if isinstance(val, bytes):
-            try:
-                return val.decode("utf-8")
-            except Exception:
-                return val.hex()
-        return val
+    safe_rows = sanitize_rows(rows)
+    messages = _summary_messages(original_query, sql, safe_rows)
+    if messages is None:
+        return {"message": SMALL_RESULT_MESSAGE.format(count=len(rows)), "rows": safe_rows}
     
-    safe_rows = [{k: sanitize(v) for k, v in row.items()} for row in rows]
+    response = chat_model.invoke(messages)
+    message = _get_llm_response(response.content).strip()
     
-    system_prompt = """You are a helpful data analyst. Present the query results clearly and conversationally.
-Always end by asking: "Would you like me to save this as CSV, Excel, or PDF?"
-Do NOT respond in JSON - just write a natural message."""
+    return {"message": message, "rows": safe_rows}
 
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Question: {original_query}\nSQL: {sql}\nResults ({len(rows)} rows):\n{json.dumps(safe_rows, indent=2)}"},
-    ]
+
+async def aformat_sql_results(original_query: str, sql: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Async variant of format_sql_results using ainvoke for the summary."""
+    if not rows:
+        return {"message": "The query returned no results.", "rows": []}
     
-    response = chat_model.invoke(messages)
+    safe_rows = await asyncio.to_thread(sanitize_rows, rows)
+    messages = _summary_messages(original_query, sql, safe_rows)
+    if messages is None:
+        return {"message": SMALL_RESULT_MESSAGE.format(count=len(rows)), "rows": safe_rows}
+    
+    response = await chat_model.ainvoke(messages)
     message = _get_llm_response(response.content).strip()
     
     return {"message": message, "rows": safe_rows}
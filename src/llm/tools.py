@@ -1,5 +1,7 @@
 """LLM tool definitions."""
 
+from src.charts import CHART_THEMES
+
 EXPORT_TOOLS = [
     {
         "type": "function",
@@ -53,3 +55,49 @@ CHART_TOOLS = [
         }
     }
 ]
+
+_EXPORT_FORMAT = {"type": "string", "enum": ["csv", "excel", "pdf"]}
+
+# Structured-output schema for run_llm replies. Strict mode requires every
+# field, so fields a response type doesn't use are null.
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {
+            "type": "string",
+            "enum": ["sql", "sql_and_export", "sql_and_chart", "chart", "export", "message"]
+        },
+        "sql": {"type": ["string", "null"]},
+        "format": {
+            "anyOf": [_EXPORT_FORMAT, {"type": "array", "items": _EXPORT_FORMAT}, {"type": "null"}]
+        },
+        "chart_type": {"type": ["string", "null"], "enum": ["bar", "line", "pie", "scatter", None]},
+        "x_column": {"type": ["string", "null"]},
+        "y_column": {"type": ["string", "null"]},
+        "title": {"type": ["string", "null"]},
+        "theme": {"type": ["string", "null"], "enum": [*CHART_THEMES, None]},
+        "content": {"type": ["string", "null"]}
+    },
+    "required": ["type", "sql", "format", "chart_type", "x_column", "y_column", "title", "theme", "content"],
+    "additionalProperties": False
+}
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "assistant_response", "strict": True, "schema": RESPONSE_SCHEMA},
+}
+
+# Batched run_llm calls answer several questions in one {"responses": [...]} object
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "batched_assistant_responses",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"responses": {"type": "array", "items": RESPONSE_SCHEMA}},
+            "required": ["responses"],
+            "additionalProperties": False
+        },
+    },
+}
@@ -1,5 +1,6 @@
 """SQL query execution."""
 
-from .executor import run_sql_query
+from .executor import run_sql_query, load_schema_ddl
+from .sanitize import sanitize_frame, sanitize_rows
 
-__all__ = ["run_sql_query"]
+__all__ = ["run_sql_query", "load_schema_ddl", "sanitize_frame", "sanitize_rows"]
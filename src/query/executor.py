@@ -1,5 +1,6 @@
 """SQL query execution."""
 
+import queue
 import sqlite3
 import re
 import os
@@ -13,6 +14,18 @@ FORBIDDEN_SQL = re.compile(
     re.IGNORECASE
 )
 
+# Idle read-only connections kept per database so queries skip reconnecting
+CONN_POOL_SIZE = 4
+
+_CONN_POOL: Dict[str, "queue.LifoQueue[sqlite3.Connection]"] = {}
+
+
+def _default_db_path() -> str:
+    """Absolute path of the app database, independent of the working directory."""
+    # Go up 3 levels: executor.py -> query -> src -> project root
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    return os.path.join(project_root, "data", "app.db")
+
 
 def _validate_sql(sql: str) -> None:
     """Validate SQL query for safety."""
@@ -34,6 +47,39 @@ def _validate_sql(sql: str) -> None:
         raise ValueError("Multiple SQL statements are not allowed")
 
 
+def _prepare_sql(sql: str, limit: int) -> str:
+    """Validate the query and enforce a LIMIT if it has none."""
+    _validate_sql(sql)
+
+    sql = sql.strip().rstrip(";")
+
+    # Enforce LIMIT if missing
+    if " limit " not in f" {sql.lower()} ":
+        sql = f"{sql} LIMIT {limit}"
+
+    return sql
+
+
+def _acquire_connection(db_path: str) -> sqlite3.Connection:
+    """Take an idle connection from the pool, or open a new read-only one."""
+    pool = _CONN_POOL.setdefault(db_path, queue.LifoQueue(maxsize=CONN_POOL_SIZE))
+    try:
+        return pool.get_nowait()
+    except queue.Empty:
+        # Read-only URI: a missing database is not silently created, and
+        # connections may be handed between Streamlit's script threads,
+        # one user at a time
+        return sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+
+
+def _release_connection(conn: sqlite3.Connection, db_path: str):
+    """Return a connection to the pool, closing it if the pool is already full."""
+    try:
+        _CONN_POOL[db_path].put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
 def run_sql_query(
     sql: str,
     db_path: Optional[str] = None,
@@ -47,31 +93,58 @@ def run_sql_query(
       - {"error": "error message"} on failure
     """
 
-    _validate_sql(sql)
-
-    sql = sql.strip().rstrip(";")
-
-    # Enforce LIMIT if missing
-    if " limit " not in f" {sql.lower()} ":
-        sql = f"{sql} LIMIT {limit}"
+    sql = _prepare_sql(sql, limit)
 
     # Use absolute path to avoid relative path issues with Streamlit reruns
-    if db_path is None:
-        # Go up 3 levels: executor.py -> query -> src -> project root
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        db_path = os.path.join(project_root, "data", "app.db")
-
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    db_path = db_path or _default_db_path()
+    conn = None
+    cursor = None
 
     try:
+        conn = _acquire_connection(db_path)
+        # Plain tuples zipped with the column names once, instead of a
+        # sqlite3.Row object per row converted to a dict afterwards
         cursor = conn.execute(sql)
-        rows = cursor.fetchall()
-        return {"rows": [dict(row) for row in rows]}
+        columns = [col[0] for col in cursor.description]
+        return {"rows": [dict(zip(columns, row)) for row in cursor.fetchall()]}
 
     except sqlite3.Error as e:
         # Return the SQLite error message instead of raising so UI can display it
         return {"error": str(e)}
 
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            _release_connection(conn, db_path)
+
+
+def load_schema_ddl(db_path: Optional[str] = None) -> Optional[str]:
+    """
+    Return the CREATE TABLE statements of every user table in the database.
+
+    SQLite's internal tables (sqlite_sequence, sqlite_stat1, ...) are left out.
+
+    Returns None if the database does not exist or cannot be read.
+    """
+    db_path = db_path or _default_db_path()
+
+    try:
+        # Read-only URI so a missing database is not silently created
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    except sqlite3.Error:
+        return None
+
+    try:
+        rows = conn.execute(
+            "SELECT sql FROM sqlite_master "
+            "WHERE type = 'table' AND sql IS NOT NULL AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\' "
+            "ORDER BY name"
+        ).fetchall()
+        return "\n\n".join(row[0] for row in rows)
+
+    except sqlite3.Error:
+        return None
+
     finally:
         conn.close()
@@ -0,0 +1,45 @@
+"""Sanitizing query result rows for display, serialization and export."""
+
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+
+
+def _decode_bytes(val: bytes) -> str:
+    """Decode a BLOB value as UTF-8, falling back to hex."""
+    try:
+        return val.decode("utf-8")
+    except UnicodeDecodeError:
+        return val.hex()
+
+
+def sanitize_frame(rows: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, bool]:
+    """Build a column-wise DataFrame of rows with bytes values decoded.
+    
+    Returns the frame and whether any values were decoded. Bytes are found
+    per column rather than per cell.
+    """
+    # object dtype keeps values as-is (no None -> NaN or int -> float coercion)
+    df = pd.DataFrame(rows, dtype=object)
+    has_bytes = False
+    for col in df.columns:
+        mask = df[col].map(type).eq(bytes)
+        if mask.any():
+            df.loc[mask, col] = df.loc[mask, col].map(_decode_bytes)
+            has_bytes = True
+    
+    return df, has_bytes
+
+
+def sanitize_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Decode bytes values so rows are JSON serializable.
+    
+    Rows without any bytes values are returned unchanged, without building
+    a DataFrame.
+    """
+    # A flat scan with no per-value calls is far cheaper than constructing
+    # a frame, and most results contain no BLOBs
+    if not any(type(v) is bytes for row in rows for v in row.values()):
+        return rows
+    df, has_bytes = sanitize_frame(rows)
+    return df.to_dict("records") if has_bytes else rows
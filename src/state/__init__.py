@@ -1,5 +1,5 @@
 """Session state management."""
 
-from .session import init_session_state, add_message, clear_chat
+from .session import HISTORY_WINDOW, init_session_state, add_message, clear_chat
 
-__all__ = ["init_session_state", "add_message", "clear_chat"]
+__all__ = ["HISTORY_WINDOW", "init_session_state", "add_message", "clear_chat"]
@@ -1,17 +1,36 @@
 """Session state management."""
 
+from uuid import uuid4
+
 import streamlit as st
 
+WELCOME_MESSAGE = "Ask me questions about the company data or schema."
+
+
+# Messages drawn per full rerun; older ones are shown on request
+HISTORY_WINDOW = 20
+
+# Assistant messages starting with this are rendered as errors
+SQL_ERROR_PREFIX = "SQL execution failed"
+
+
+def _new_message(role: str, content: str, **kwargs) -> dict:
+    """Build a chat message with a stable id for widget keys.
+    
+    Error messages are tagged once here so rendering needs no string checks.
+    """
+    msg = {"id": uuid4().hex, "role": role, "content": content, **kwargs}
+    if role == "assistant" and isinstance(content, str) and content.startswith(SQL_ERROR_PREFIX):
+        msg["is_error"] = True
+    return msg
+
 
 def init_session_state():
     """Initialize all session state variables."""
     defaults = {
-        "messages": [
-            {
-                "role": "assistant",
-                "content": "Ask me questions about the company data or schema.",
-            }
-        ],
+        "messages": [_new_message("assistant", WELCOME_MESSAGE)],
+        # How many of the most recent messages render_chat_history draws
+        "history_window": HISTORY_WINDOW,
         "last_results": None,
         "pending_sql": None,
         # Chart customization
@@ -37,18 +56,13 @@ def init_session_state():
 
 def add_message(role: str, content: str, **kwargs):
     """Add a message to chat history."""
-    msg = {"role": role, "content": content, **kwargs}
-    st.session_state.messages.append(msg)
+    st.session_state.messages.append(_new_message(role, content, **kwargs))
 
 
 def clear_chat():
     """Clear chat history and reset state."""
-    st.session_state.messages = [
-        {
-            "role": "assistant",
-            "content": "Ask me questions about the company data or schema.",
-        }
-    ]
+    st.session_state.messages = [_new_message("assistant", WELCOME_MESSAGE)]
+    st.session_state.history_window = HISTORY_WINDOW
     st.session_state.last_results = None
     st.session_state.pending_sql = None
     st.session_state.last_chart_rows = None
@@ -5,6 +5,7 @@ from .components import (
     render_chart_customization,
     render_sql_approval,
     render_chat_history,
+    render_new_messages,
 )
 from .handlers import (
     execute_sql,
@@ -13,6 +14,7 @@ from .handlers import (
     regenerate_chart_with_options,
     process_user_input,
     handle_sql_approval,
+    clear_query_cache,
 )
 
 __all__ = [
@@ -20,10 +22,12 @@ __all__ = [
     "render_chart_customization",
     "render_sql_approval",
     "render_chat_history",
+    "render_new_messages",
     "execute_sql",
     "execute_sql_and_export",
     "execute_sql_and_chart",
     "regenerate_chart_with_options",
     "process_user_input",
     "handle_sql_approval",
+    "clear_query_cache",
 ]
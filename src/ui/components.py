@@ -1,176 +1,252 @@
 """UI components for the SchemaSense chat interface."""
 
 from typing import Any, Dict, List, Optional
-import io
+import math
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
-from streamlit_extras.stylable_container import stylable_container
+from src.charts import CHART_THEMES
+from src.state import HISTORY_WINDOW
+from src.ui.handlers import handle_sql_approval, regenerate_chart_with_options
+
+_THEME_NAMES = list(CHART_THEMES)
+
+# Rows per page of the chart data preview
+PREVIEW_PAGE_SIZE = 500
+
+# Approval button styles as one stylesheet. Keyed containers get an
+# st-key-<key> class, so no custom component is needed to scope the rules.
+_APPROVAL_BUTTON_CSS = """<style>
+.st-key-green_button button {
+    background-color: #16a34a;
+    color: white;
+    border: none;
+}
+.st-key-green_button button:hover {
+    background-color: #15803d;
+    color: white;
+}
+.st-key-red_button button {
+    background-color: #dc2626;
+    color: white;
+    border: none;
+}
+.st-key-red_button button:hover {
+    background-color: #b91c1c;
+    color: white;
+}
+</style>"""
 
 
 def render_message(msg: Dict[str, Any], idx: int):
     """Render a single chat message."""
-    from src.state import add_message
-    
     role = msg.get("role", "assistant")
     content = msg.get("content", "")
     file_data = msg.get("file_data")
     chart_data = msg.get("chart_data")
-    
-    # Check for error message styling
-    is_error = (
-        role == "assistant" 
-        and isinstance(content, str) 
-        and content.startswith("SQL execution failed")
-    )
+    result_rows = msg.get("result_rows")
+    # Widget keys follow the message id so they stay stable across reruns
+    msg_id = msg.get("id")
+    key = msg_id or idx
     
     with st.chat_message(role):
-        if is_error:
+        # Tagged by add_message for error message styling
+        if msg.get("is_error"):
             st.error(content)
         else:
             st.markdown(content)
         
         # Display chart if present
         if chart_data:
-            st.image(io.BytesIO(chart_data), use_container_width=True)
+            file_name = msg.get("file_name", "chart.png")
+            file_mime = msg.get("file_mime", "image/png")
+            # st.image takes raster bytes as-is, but SVG as markup
+            image = chart_data.decode("utf-8") if file_mime == "image/svg+xml" else chart_data
+            st.image(image, use_container_width=True)
             st.download_button(
-                label=f"Download {msg.get('file_name', 'chart.png')}",
+                label=f"Download {file_name}",
                 data=chart_data,
-                file_name=msg.get("file_name", "chart.png"),
-                mime=msg.get("file_mime", "image/png"),
+                file_name=file_name,
+                mime=file_mime,
                 use_container_width=True,
-                key=f"chart_download_{idx}",
+                key=f"chart_download_{key}",
             )
             
             # Show customization UI after chart
             render_chart_customization()
         
+        # Query results table
+        if result_rows:
+            st.dataframe(result_rows, use_container_width=True, hide_index=True)
+        
         # Download button for export messages
         if file_data:
+            file_name = msg.get("file_name")
             st.download_button(
-                label=f"Download {msg.get('file_name', 'file')}",
+                label=f"Download {file_name or 'file'}",
                 data=file_data,
-                file_name=msg.get("file_name"),
+                file_name=file_name,
                 mime=msg.get("file_mime"),
                 use_container_width=True,
-                key=f"download_{idx}",
+                key=f"download_{key}",
             )
 
 
+def _chart_rows_table(rows: List[Dict[str, Any]]) -> Optional[pa.Table]:
+    """Columnar Arrow copy of last_chart_rows, built once per result set.
+    
+    Streamlit ships dataframes to the browser as Arrow, so slices of this
+    table go out without a pandas round trip. Returns None when a column
+    mixes types Arrow can't unify.
+    """
+    cached = st.session_state.get("_chart_rows_table")
+    # Compare by identity: last_chart_rows is always replaced, never mutated
+    if cached is None or cached[0] is not rows:
+        try:
+            table = pa.Table.from_pylist(rows)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            table = None
+        cached = (rows, table)
+        st.session_state._chart_rows_table = cached
+    return cached[1]
+
+
+def _render_rows_page(rows: List[Dict[str, Any]], limit: Optional[int], page_size: int):
+    """Show one page of the first ``limit`` rows, sending only that slice to the browser."""
+    total = len(rows) if limit is None else min(limit, len(rows))
+    n_pages = max(1, math.ceil(total / page_size))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, key="preview_page") if n_pages > 1 else 1
+    start = (page - 1) * page_size
+    length = min(page_size, total - start)
+    
+    table = _chart_rows_table(rows)
+    data = table.slice(start, length) if table is not None else pd.DataFrame(rows[start:start + length])
+    st.dataframe(data, use_container_width=True, height=300)
+    if n_pages > 1:
+        st.caption(f"Rows {start + 1}-{start + length} of {total}")
+
+
+@st.fragment
 def render_chart_customization():
-    """Render chart customization options."""
-    from src.charts import CHART_THEMES
+    """Render chart customization options.
     
+    Runs as a fragment, so paging the data preview reruns only this panel
+    rather than the whole chat history; a regenerated chart still triggers a
+    full rerun to redraw the chart message above it.
+    """
     if not st.session_state.get("last_chart_rows"):
         return
     
     with st.expander("Chart Customization", expanded=False):
-        # Theme and Color
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            theme = st.selectbox(
-                "Theme",
-                options=list(CHART_THEMES.keys()),
-                index=list(CHART_THEMES.keys()).index(st.session_state.get("chart_theme", "default")),
-                key="theme_select",
-            )
-            st.session_state.chart_theme = theme
-        
-        with col2:
-            color = st.color_picker(
-                "Custom Color",
-                value=st.session_state.get("chart_color", "#4f46e5"),
-                key="color_picker",
-            )
-            st.session_state.chart_color = color
-        
-        # Grid, Legend, and Font Size
-        col3, col4, col5 = st.columns(3)
-        
-        with col3:
-            show_grid = st.checkbox(
-                "Show Grid",
-                value=st.session_state.get("chart_show_grid", True),
-                key="grid_check",
-            )
-            st.session_state.chart_show_grid = show_grid
-        
-        with col4:
-            show_legend = st.checkbox(
-                "Show Legend",
-                value=st.session_state.get("chart_show_legend", False),
-                key="legend_check",
-            )
-            st.session_state.chart_show_legend = show_legend
-        
-        with col5:
-            font_size = st.slider(
-                "Text Size (pt)",
-                min_value=8,
-                max_value=20,
-                value=st.session_state.get("chart_font_size", 10),
-                step=1,
-                key="font_size_slider",
+        # A form batches the option changes into a single rerun on submit
+        with st.form("chart_customize", clear_on_submit=False, border=False):
+            # Theme and Color
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                theme = st.selectbox(
+                    "Theme",
+                    options=_THEME_NAMES,
+                    index=_THEME_NAMES.index(st.session_state.get("chart_theme", "default")),
+                    key="theme_select",
+                )
+                st.session_state.chart_theme = theme
+            
+            with col2:
+                color = st.color_picker(
+                    "Custom Color",
+                    value=st.session_state.get("chart_color", "#4f46e5"),
+                    key="color_picker",
+                )
+                st.session_state.chart_color = color
+            
+            # Grid, Legend, and Font Size
+            col3, col4, col5 = st.columns(3)
+            
+            with col3:
+                show_grid = st.checkbox(
+                    "Show Grid",
+                    value=st.session_state.get("chart_show_grid", True),
+                    key="grid_check",
+                )
+                st.session_state.chart_show_grid = show_grid
+            
+            with col4:
+                show_legend = st.checkbox(
+                    "Show Legend",
+                    value=st.session_state.get("chart_show_legend", False),
+                    key="legend_check",
+                )
+                st.session_state.chart_show_legend = show_legend
+            
+            with col5:
+                font_size = st.slider(
+                    "Text Size (pt)",
+                    min_value=8,
+                    max_value=20,
+                    value=st.session_state.get("chart_font_size", 10),
+                    step=1,
+                    key="font_size_slider",
+                )
+                st.session_state.chart_font_size = font_size
+            
+            # Row limit selector
+            st.divider()
+            st.markdown("**Data Display Options**")
+            
+            row_limit = st.selectbox(
+                "Rows to Display",
+                options=[10, 25, 50, 100, 500, "All"],
+                index=st.session_state.get("chart_row_limit_idx", 1),
+                key="row_limit_select",
             )
-            st.session_state.chart_font_size = font_size
-        
-        # Row limit selector
-        st.divider()
-        st.markdown("**Data Display Options**")
-        
-        row_limit = st.selectbox(
-            "Rows to Display",
-            options=[10, 25, 50, 100, 500, "All"],
-            index=st.session_state.get("chart_row_limit_idx", 1),
-            key="row_limit_select",
-        )
-        st.session_state.chart_row_limit = row_limit if row_limit == "All" else int(row_limit)
-        st.session_state.chart_row_limit_idx = [10, 25, 50, 100, 500, "All"].index(row_limit)
-
-        st.divider()
-        
-        if st.button("Regenerate Chart", use_container_width=True, key="regen_chart"):
-            from src.ui.handlers import regenerate_chart_with_options
-            new_chart = regenerate_chart_with_options()
-            if new_chart:
-                # Update the last message with new chart
-                if st.session_state.messages:
-                    st.session_state.messages[-1]["chart_data"] = new_chart["chart_data"]
-                    st.session_state.messages[-1]["file_name"] = new_chart["file_name"]
-                st.rerun()
-            else:
-                st.error("Failed to regenerate chart")
-        
+            st.session_state.chart_row_limit = row_limit if row_limit == "All" else int(row_limit)
+            st.session_state.chart_row_limit_idx = [10, 25, 50, 100, 500, "All"].index(row_limit)
+
+            st.divider()
+            
+            if st.form_submit_button("Regenerate Chart", use_container_width=True):
+                new_chart = regenerate_chart_with_options()
+                if new_chart:
+                    # Update the last message with new chart
+                    if st.session_state.messages:
+                        st.session_state.messages[-1]["chart_data"] = new_chart["chart_data"]
+                        st.session_state.messages[-1]["file_name"] = new_chart["file_name"]
+                    st.rerun()
+                else:
+                    st.error("Failed to regenerate chart")
+            
         # Display data table with selected columns
         if st.session_state.get("last_chart_rows"):
             st.markdown("**Data Preview**")
             
-            rows_to_show = st.session_state.get("last_chart_rows", [])
             row_limit = st.session_state.get("chart_row_limit", 25)
-            
-            if row_limit != "All":
-                rows_to_show = rows_to_show[:row_limit]
-            
-            # Create dataframe
-            df_display = pd.DataFrame(rows_to_show)
-            st.dataframe(df_display, use_container_width=True, height=300)
+            _render_rows_page(
+                st.session_state["last_chart_rows"],
+                None if row_limit == "All" else row_limit,
+                PREVIEW_PAGE_SIZE,
+            )
 
 
 def render_sql_approval(
     sql: str,
     auto_export: bool = False,
-    export_format: Optional[str] = None,
+    export_formats: Optional[List[str]] = None,
     auto_chart: bool = False,
     chart_type: Optional[str] = None,
 ):
-    """Render SQL approval UI."""
-    from src.ui.handlers import handle_sql_approval
+    """Render SQL approval UI.
     
+    Must be called from within a fragment: Allow/Deny rerun only that
+    fragment, which draws the resulting messages below the history.
+    """
+    st.html(_APPROVAL_BUTTON_CSS)
     st.markdown("**The model wants to run this SQL:**")
     st.code(sql, language="sql")
     
-    if auto_export and export_format:
-        st.info(f"Will automatically export as **{export_format.upper()}** after execution")
+    if auto_export and export_formats:
+        formats = ", ".join(fmt.upper() for fmt in export_formats)
+        st.info(f"Will automatically export as **{formats}** after execution")
     
     if auto_chart and chart_type:
         st.info(f"Will automatically generate a **{chart_type.upper()}** chart after execution")
@@ -178,45 +254,42 @@ def render_sql_approval(
     col1, col2 = st.columns(2)
     
     with col1:
-        with stylable_container(
-            "green_button",
-            css_styles="""
-            button {
-                background-color: #16a34a;
-                color: white;
-                border: none;
-            }
-            button:hover {
-                background-color: #15803d;
-                color: white;
-            }
-            """,
-        ):
-            if st.button("Allow & Run", use_container_width=True):
-                handle_sql_approval(True)
-                st.rerun()
+        with st.container(key="green_button"):
+            allowed = st.button("Allow & Run", use_container_width=True)
     
     with col2:
-        with stylable_container(
-            "red_button",
-            css_styles="""
-            button {
-                background-color: #dc2626;
-                color: white;
-                border: none;
-            }
-            button:hover {
-                background-color: #b91c1c;
-                color: white;
-            }
-            """,
-        ):
-            if st.button("Deny", use_container_width=True):
-                handle_sql_approval(False)
-                st.rerun()
+        with st.container(key="red_button"):
+            denied = st.button("Deny", use_container_width=True)
+    
+    if allowed:
+        # Show each stage while the query, LLM formatting or plotting runs
+        with st.status("Running SQL...", expanded=False) as status:
+            handle_sql_approval(True, progress_cb=lambda label: status.update(label=label))
+        st.rerun(scope="fragment")
+    elif denied:
+        handle_sql_approval(False)
+        st.rerun(scope="fragment")
 
 
 def render_chat_history():
-    """Render all chat messages."""
-    for idx, msg in enumerate(st.session_state.messages):
-        render_message(msg, idx)
+    """Render the most recent chat messages.
+    
+    Only the last ``history_window`` messages are drawn; older ones stay in
+    session state and are revealed HISTORY_WINDOW at a time on request.
+    """
+    messages = st.session_state.messages
+    start = max(0, len(messages) - st.session_state.get("history_window", HISTORY_WINDOW))
+    if start and st.button(f"Show earlier messages ({start} hidden)", use_container_width=True):
+        st.session_state.history_window += HISTORY_WINDOW
+        st.rerun()
+    for idx in range(start, len(messages)):
+        render_message(messages[idx], idx)
+    # Later fragment reruns only draw what is added after this point
+    st.session_state._history_len = len(st.session_state.messages)
+
+
+def render_new_messages():
+    """Render messages added since the last full render_chat_history pass."""
+    messages = st.session_state.messages
+    for idx in range(st.session_state.get("_history_len", len(messages)), len(messages)):
+        render_message(messages[idx], idx)
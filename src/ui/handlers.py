@@ -1,27 +1,103 @@
 """Event handlers for SQL execution, chart generation, and user input processing."""
 
-from typing import Any, Dict, List, Optional
+import hashlib
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+import orjson
 import streamlit as st
-from src.query import run_sql_query
-from src.export import generate_export
+from src.query import run_sql_query, sanitize_frame, sanitize_rows
+from src.export import generate_exports
 from src.charts import generate_chart
-from src.llm import run_llm, format_sql_results
+from src.llm import llm_raw_reply, route_llm_reply, format_sql_results
 from src.state import add_message
 
+# Export queries that are a single bounded SELECT may skip the approval
+# round trip when AUTO_APPROVE_SQL is enabled
+AUTO_APPROVE_SQL = os.getenv("AUTO_APPROVE_SQL", "").lower() in ("1", "true", "yes")
 
-def execute_sql(sql: str, original_query: str) -> Optional[Dict[str, Any]]:
+_RE_READ_ONLY_SELECT = re.compile(r"^\s*SELECT\b[^;]*\bLIMIT\s+\d+\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_RE_WRITE_TOKENS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|REPLACE|UPSERT|MERGE|CREATE|ALTER|DROP|TRUNCATE|ATTACH|DETACH|PRAGMA|VACUUM|REINDEX)\b",
+    re.IGNORECASE,
+)
+
+
+# Receives a short label for each stage of a long-running SQL handler
+ProgressCallback = Callable[[str], Any]
+
+
+def _report(progress_cb: Optional[ProgressCallback], label: str):
+    """Forward a stage label to the progress callback, if any."""
+    if progress_cb is not None:
+        progress_cb(label)
+
+
+def _is_auto_approvable(sql: Optional[str]) -> bool:
+    """Whether sql is a single read-only SELECT with a LIMIT clause."""
+    return bool(
+        AUTO_APPROVE_SQL
+        and sql
+        and _RE_READ_ONLY_SELECT.match(sql)
+        and not _RE_WRITE_TOKENS.search(sql)
+    )
+
+
+class _QueryError(Exception):
+    """SQLite error from a cached query; raised so failures are never cached."""
+
+
+@st.cache_data(ttl=300, max_entries=128, show_spinner=False)
+def _cached_rows(sql: str) -> List[Dict[str, Any]]:
+    """Rows of a successful query; Streamlit returns a fresh copy per call."""
+    result = run_sql_query(sql)
+    if result.get("error"):
+        raise _QueryError(result["error"])
+    return result["rows"]
+
+
+def _run_sql(sql: str) -> Dict[str, Any]:
+    """run_sql_query memoized on the SQL text for a few minutes.
+    
+    Re-approving or re-running the same query (e.g. after a denial) is
+    served from the cache instead of hitting the database again.
+    """
+    try:
+        return {"rows": _cached_rows(sql)}
+    except _QueryError as e:
+        return {"error": str(e)}
+
+
+def clear_query_cache():
+    """Forget cached query results and LLM replies, e.g. after the database was rebuilt.
+    
+    Cached replies hold SQL written against the old schema and summaries of
+    the old rows, so they are dropped together with the rows.
+    """
+    _cached_rows.clear()
+    _cached_llm_reply.clear()
+    _cached_format_sql_results.clear()
+
+
+def execute_sql(
+    sql: str,
+    original_query: str,
+    progress_cb: Optional[ProgressCallback] = None,
+) -> Optional[Dict[str, Any]]:
     """Execute SQL and return formatted results."""
     try:
-        result = run_sql_query(sql)
+        _report(progress_cb, "Running SQL...")
+        result = _run_sql(sql)
         
-        if isinstance(result, dict) and result.get("error"):
-            return {"error": result.get("error")}
+        if result.get("error"):
+            return {"error": result["error"]}
         
-        rows = result.get("rows") if isinstance(result, dict) else result
-        rows = rows if isinstance(rows, list) else []
+        rows = result["rows"]
         
-        # Format results using LLM
-        formatted = format_sql_results(original_query, sql, rows)
+        # Format results using LLM (memoized for repeat runs of the same query)
+        _report(progress_cb, "Formatting results...")
+        formatted = _cached_format_sql_results(original_query, sql, _results_hash(rows), rows)
         
         return {
             "success": True,
@@ -32,49 +108,59 @@ def execute_sql(sql: str, original_query: str) -> Optional[Dict[str, Any]]:
         return {"error": str(e)}
 
 
-def execute_sql_and_export(sql: str, original_query: str, export_format: str) -> Dict[str, Any]:
-    """Execute SQL, format results, and generate export file."""
+def execute_sql_and_export(
+    sql: str,
+    original_query: str,
+    export_formats: List[str],
+    progress_cb: Optional[ProgressCallback] = None,
+) -> Dict[str, Any]:
+    """Execute SQL, format results, and generate one export file per format."""
     try:
-        result = run_sql_query(sql)
+        _report(progress_cb, "Running SQL...")
+        result = _run_sql(sql)
         
-        if isinstance(result, dict) and result.get("error"):
-            return {"error": result.get("error")}
+        if result.get("error"):
+            return {"error": result["error"]}
         
-        rows = result.get("rows") if isinstance(result, dict) else result
-        rows = rows if isinstance(rows, list) else []
+        rows = result["rows"]
         
         if not rows:
             return {"error": "Query returned no results to export."}
         
-        # Sanitize rows
-        def sanitize(val):
-            if isinstance(val, bytes):
-                try:
-                    return val.decode("utf-8")
-                except Exception:
-                    return val.hex()
-            return val
-        
-        safe_rows = [{k: sanitize(v) for k, v in row.items()} for row in rows]
+        # Decode BLOB values into one column-wise frame that every export
+        # format reads; row dicts are only rebuilt if something was decoded
+        frame, decoded = sanitize_frame(rows)
+        safe_rows = frame.to_dict("records") if decoded else rows
         
-        # Generate export
-        export_result = generate_export(safe_rows, export_format)
+        # Generate exports (concurrently when several formats were requested)
+        _report(progress_cb, "Writing exports...")
+        export_results = generate_exports(frame, export_formats)
         
-        if not export_result["success"]:
-            return {"error": export_result["error"]}
+        errors = [r["error"] for r in export_results.values() if not r["success"]]
+        if errors:
+            return {"error": "; ".join(errors)}
         
         return {
             "success": True,
             "rows": safe_rows,
-            "file_data": export_result["file_data"],
-            "file_name": export_result["file_name"],
-            "mime": export_result["mime"],
-            "format": export_format,
+            "exports": export_results,
         }
     except Exception as e:
         return {"error": str(e)}
 
 
+def _chart_options() -> Dict[str, Any]:
+    """Chart customization options from session state, as generate_chart kwargs."""
+    state = st.session_state
+    return {
+        "theme": state.get("chart_theme", "default"),
+        "color": state.get("chart_color"),
+        "show_grid": state.get("chart_show_grid", True),
+        "show_legend": state.get("chart_show_legend", False),
+        "font_size": state.get("chart_font_size", 10),
+    }
+
+
 def execute_sql_and_chart(
     sql: str,
     original_query: str,
@@ -82,43 +168,33 @@ def execute_sql_and_chart(
     x_column: str,
     y_column: str,
     title: Optional[str] = None,
+    progress_cb: Optional[ProgressCallback] = None,
 ) -> Dict[str, Any]:
     """Execute SQL and generate chart from results."""
     try:
-        result = run_sql_query(sql)
+        _report(progress_cb, "Running SQL...")
+        result = _run_sql(sql)
         
-        if isinstance(result, dict) and result.get("error"):
-            return {"error": result.get("error")}
+        if result.get("error"):
+            return {"error": result["error"]}
         
-        rows = result.get("rows") if isinstance(result, dict) else result
-        rows = rows if isinstance(rows, list) else []
+        rows = result["rows"]
         
         if not rows:
             return {"error": "Query returned no results to chart."}
         
-        # Sanitize rows
-        def sanitize(val):
-            if isinstance(val, bytes):
-                try:
-                    return val.decode("utf-8")
-                except Exception:
-                    return val.hex()
-            return val
-        
-        safe_rows = [{k: sanitize(v) for k, v in row.items()} for row in rows]
+        # Decode BLOB values column-wise
+        safe_rows = sanitize_rows(rows)
         
         # Generate chart
+        _report(progress_cb, "Plotting chart...")
         chart_result = generate_chart(
             safe_rows,
             chart_type,
             x_column,
             y_column,
             title,
-            theme=st.session_state.get("chart_theme", "default"),
-            color=st.session_state.get("chart_color"),
-            show_grid=st.session_state.get("chart_show_grid", True),
-            show_legend=st.session_state.get("chart_show_legend", False),
-            font_size=st.session_state.get("chart_font_size", 10),
+            **_chart_options(),
         )
         
         if not chart_result["success"]:
@@ -162,90 +238,197 @@ def regenerate_chart_with_options():
         x_col,
         y_col,
         st.session_state.get("last_chart_title"),
-        theme=st.session_state.get("chart_theme", "default"),
-        color=st.session_state.get("chart_color"),
-        show_grid=st.session_state.get("chart_show_grid", True),
-        show_legend=st.session_state.get("chart_show_legend", False),
-        font_size=st.session_state.get("chart_font_size", 10),
+        **_chart_options(),
     )
     
     return chart_result if chart_result.get("success") else None
 
 
+def _results_hash(rows: Optional[List[Dict[str, Any]]]) -> str:
+    """Stable digest of the current results, used as part of the LLM cache key."""
+    # Row dicts keep the cursor's column order, so no key sorting is needed
+    payload = orjson.dumps(rows, default=str)
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _last_results_hash(rows: Optional[List[Dict[str, Any]]]) -> str:
+    """_results_hash of last_results, recomputed only when the list is replaced."""
+    cached = st.session_state.get("_last_results_digest")
+    # Compare by identity: last_results is always replaced, never mutated
+    if cached is None or cached[0] is not rows:
+        cached = (rows, _results_hash(rows))
+        st.session_state._last_results_digest = cached
+    return cached[1]
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _cached_llm_reply(
+    prompt: str,
+    results_hash: str,
+    _last_results: Optional[List[Dict[str, Any]]],
+    _batch_key: str,
+) -> Tuple[str, List[Any]]:
+    """llm_raw_reply memoized on the prompt and a digest of the current results.
+    
+    Only the raw reply and its schema docs are stored; exports and charts are
+    rendered from them afterwards, so no file bytes end up in the cache. The
+    results themselves are excluded from Streamlit's argument hashing
+    (leading underscore); results_hash stands in for them. The batch key only
+    decides which queries may share a batched call, so it isn't hashed either.
+    """
+    return llm_raw_reply(prompt, _last_results, _batch_key)
+
+
+def _session_batch_key() -> str:
+    """Per-session key, so batched LLM calls never mix different users' questions."""
+    if "_batch_key" not in st.session_state:
+        st.session_state._batch_key = uuid4().hex
+    return st.session_state._batch_key
+
+
+def _llm_reply(prompt: str, last_results: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """run_llm with the raw reply served from cache and routed afresh each time."""
+    raw, docs = _cached_llm_reply(prompt, _last_results_hash(last_results), last_results, _session_batch_key())
+    return route_llm_reply(raw, docs, last_results)
+
+
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _cached_format_sql_results(
+    original_query: str,
+    sql: str,
+    rows_hash: str,
+    _rows: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """format_sql_results memoized on the question, the SQL and a digest of the rows."""
+    return format_sql_results(original_query, sql, _rows)
+
+
+def _handle_export_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Export file response."""
+    add_message(
+        "assistant",
+        result.get("answer", "Here you go!"),
+        file_data=result.get("file_data"),
+        file_name=result.get("file_name"),
+        file_mime=result.get("mime"),
+    )
+    return {"type": "export"}
+
+
+def _handle_chart_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Chart from existing data."""
+    add_message(
+        "assistant",
+        result.get("answer", "Here's your chart!"),
+        chart_data=result.get("chart_data"),
+        file_name=result.get("file_name"),
+        file_mime=result.get("mime"),
+    )
+    return {"type": "chart"}
+
+
+def _handle_sql_and_chart_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """SQL + Chart combined - store for approval."""
+    sql = result.get("sql")
+    st.session_state.pending_sql = {
+        "sql": sql,
+        "original_query": prompt,
+        "chart_type": result.get("chart_type", "bar"),
+        "x_column": result.get("x_column"),
+        "y_column": result.get("y_column"),
+        "title": result.get("title"),
+        "auto_chart": True,
+    }
+    return {"type": "sql_and_chart", "sql": sql}
+
+
+def _handle_sql_and_export_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """SQL + Export combined - store for approval."""
+    sql = result.get("sql")
+    export_formats = result.get("export_formats", ["csv"])
+    
+    if _is_auto_approvable(sql):
+        # Trusted read-only query: run it now instead of waiting for approval
+        _run_export(sql, prompt, export_formats)
+        return {"type": "sql_and_export", "sql": sql, "formats": export_formats}
+    
+    st.session_state.pending_sql = {
+        "sql": sql,
+        "original_query": prompt,
+        "export_formats": export_formats,
+        "auto_export": True,
+    }
+    return {"type": "sql_and_export", "sql": sql, "formats": export_formats}
+
+
+def _handle_sql_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """SQL query needs approval."""
+    sql = result.get("sql")
+    st.session_state.pending_sql = {
+        "sql": sql,
+        "original_query": prompt,
+    }
+    return {"type": "sql", "sql": sql}
+
+
+def _handle_answer_response(prompt: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Direct answer."""
+    add_message("assistant", result.get("answer", "No answer returned."))
+    return {"type": "answer"}
+
+
+# LLM response type -> handler; unknown types are treated as a direct answer
+_RESPONSE_HANDLERS = {
+    "export": _handle_export_response,
+    "chart": _handle_chart_response,
+    "sql_and_chart": _handle_sql_and_chart_response,
+    "sql_and_export": _handle_sql_and_export_response,
+    "sql": _handle_sql_response,
+}
+
+
 def process_user_input(prompt: str):
     """Process user input and generate response."""
     # Add user message
     add_message("user", prompt)
     
     # Get LLM response
-    result = run_llm(prompt, st.session_state.last_results)
-    response_type = result.get("type", "answer")
+    last_results = st.session_state.last_results
+    result = _llm_reply(prompt, last_results)
+    handler = _RESPONSE_HANDLERS.get(result.get("type", "answer"), _handle_answer_response)
+    return handler(prompt, result)
+
+
+def _run_export(
+    sql: str,
+    original_query: str,
+    export_formats: List[str],
+    progress_cb: Optional[ProgressCallback] = None,
+):
+    """Execute SQL and add one chat message per generated export file."""
+    result = execute_sql_and_export(sql, original_query, export_formats, progress_cb)
     
-    if response_type == "export":
-        # Export file response
-        add_message(
-            "assistant",
-            result.get("answer", "Here you go!"),
-            file_data=result.get("file_data"),
-            file_name=result.get("file_name"),
-            file_mime=result.get("mime"),
-        )
-        return {"type": "export"}
+    if result.get("error"):
+        add_message("assistant", f"SQL execution failed: {result['error']}")
+        return
     
-    elif response_type == "chart":
-        # Chart from existing data
+    st.session_state.last_results = result.get("rows", [])
+    for export_format, export_result in result["exports"].items():
         add_message(
             "assistant",
-            result.get("answer", "Here's your chart!"),
-            chart_data=result.get("chart_data"),
-            file_name=result.get("file_name"),
-            file_mime=result.get("mime"),
+            f"Here you go! Your {export_format.upper()} file with {len(result['rows'])} rows is ready.",
+            file_data=export_result["file_data"],
+            file_name=export_result["file_name"],
+            file_mime=export_result["mime"],
         )
-        return {"type": "chart"}
-    
-    elif response_type == "sql_and_chart":
-        # SQL + Chart combined - store for approval
-        sql = result.get("sql")
-        st.session_state.pending_sql = {
-            "sql": sql,
-            "original_query": prompt,
-            "chart_type": result.get("chart_type", "bar"),
-            "x_column": result.get("x_column"),
-            "y_column": result.get("y_column"),
-            "title": result.get("title"),
-            "auto_chart": True,
-        }
-        return {"type": "sql_and_chart", "sql": sql}
-    
-    elif response_type == "sql_and_export":
-        # SQL + Export combined - store for approval
-        sql = result.get("sql")
-        export_format = result.get("export_format", "csv")
-        st.session_state.pending_sql = {
-            "sql": sql,
-            "original_query": prompt,
-            "export_format": export_format,
-            "auto_export": True,
-        }
-        return {"type": "sql_and_export", "sql": sql, "format": export_format}
-    
-    elif response_type == "sql":
-        # SQL query needs approval
-        sql = result.get("sql")
-        st.session_state.pending_sql = {
-            "sql": sql,
-            "original_query": prompt,
-        }
-        return {"type": "sql", "sql": sql}
-    
-    else:
-        # Direct answer
-        add_message("assistant", result.get("answer", "No answer returned."))
-        return {"type": "answer"}
 
 
-def handle_sql_approval(approved: bool):
-    """Handle SQL approval/denial."""
+def handle_sql_approval(approved: bool, progress_cb: Optional[ProgressCallback] = None):
+    """Handle SQL approval/denial.
+    
+    ``progress_cb`` receives a label as each stage of an approved query
+    starts (running SQL, then formatting, exporting or plotting).
+    """
     pending = st.session_state.pending_sql
     
     if not pending:
@@ -255,7 +438,7 @@ def handle_sql_approval(approved: bool):
         sql = pending["sql"]
         original_query = pending["original_query"]
         auto_export = pending.get("auto_export", False)
-        export_format = pending.get("export_format", "csv")
+        export_formats = pending.get("export_formats", ["csv"])
         auto_chart = pending.get("auto_chart", False)
         
         if auto_chart:
@@ -267,6 +450,7 @@ def handle_sql_approval(approved: bool):
                 pending.get("x_column"),
                 pending.get("y_column"),
                 pending.get("title"),
+                progress_cb,
             )
             
             if result.get("error"):
@@ -290,28 +474,21 @@ def handle_sql_approval(approved: bool):
                 )
         elif auto_export:
             # Execute SQL and auto-export
-            result = execute_sql_and_export(sql, original_query, export_format)
-            
-            if result.get("error"):
-                add_message("assistant", f"SQL execution failed: {result['error']}")
-            else:
-                st.session_state.last_results = result.get("rows", [])
-                add_message(
-                    "assistant",
-                    f"Here you go! Your {export_format.upper()} file with {len(result['rows'])} rows is ready.",
-                    file_data=result["file_data"],
-                    file_name=result["file_name"],
-                    file_mime=result["mime"],
-                )
+            _run_export(sql, original_query, export_formats, progress_cb)
         else:
             # Regular SQL execution
-            result = execute_sql(sql, original_query)
+            result = execute_sql(sql, original_query, progress_cb)
             
             if result and result.get("error"):
                 add_message("assistant", f"SQL execution failed: {result['error']}")
             elif result:
                 st.session_state.last_results = result.get("rows", [])
-                add_message("assistant", result.get("message", "Query executed."))
+                # The message only narrates the result; the rows are drawn as a table
+                add_message(
+                    "assistant",
+                    result.get("message", "Query executed."),
+                    result_rows=result.get("rows", []),
+                )
     else:
         add_message("assistant", "SQL execution denied.")
     
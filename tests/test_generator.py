@@ -0,0 +1,36 @@
+"""Chart generator tests."""
+
+import pytest
+
+pytest.importorskip("matplotlib")
+
+from src.charts import generator
+from src.charts.generator import generate_chart
+
+ROWS = [
+    {"category": "Beverages", "total": 12},
+    {"category": "Condiments", "total": 7},
+    {"category": "Seafood", "total": 9},
+]
+
+
+def _chart(chart_type: str) -> bytes:
+    result = generate_chart(ROWS, chart_type, "category", "total", image_format="png")
+    assert result["success"], result.get("error")
+    return result["chart_data"]
+
+
+def test_bar_after_pie_matches_fresh_figure():
+    generator._FIG_POOL.clear()
+    fresh = _chart("bar")
+
+    generator._FIG_POOL.clear()
+    _chart("pie")
+    # The pie chart's figure is back in the pool and is reused here
+    assert _chart("bar") == fresh
+
+
+def test_bar_after_bar_matches_fresh_figure():
+    generator._FIG_POOL.clear()
+    fresh = _chart("bar")
+    assert _chart("bar") == fresh